@@ -0,0 +1,10 @@
+"""
+Exceptions shared by the API and the RAG pipeline.
+
+Kept free of heavy imports so main.py can register handlers for them without
+loading the pipeline (which stays lazily imported for fast startup).
+"""
+
+
+class ContextTooLargeError(ValueError):
+    """The question and conversation history leave no room for retrieved context."""
@@ -9,39 +9,52 @@ Architecture:
 - Two chat modes: standard (full response) and streaming (Server-Sent Events)
 
 Key design decisions:
-- Lazy loading: RAG pipeline loads on first request for fast startup (<2 sec),
-  which is critical for Render's free-tier port-binding health checks.
+- Lazy loading: RAG pipeline loads in a background task after startup (or on
+  first request, whichever comes first) for fast startup (<2 sec), which is
+  critical for Render's free-tier port-binding health checks.
 - lifespan context manager (replaces deprecated @app.on_event).
-- Streaming via LangGraph astream_events + FastAPI StreamingResponse (SSE).
+- Streaming via LangGraph astream + FastAPI StreamingResponse (SSE).
+
+Qdrant setup: park-scoped queries filter on a keyword payload index over
+park_code (data_ingestion/create_index.py).  The startup warm-up creates the
+index if it is missing, so filtering is always applied inside the HNSW search.
 
 Endpoints:
 - GET  /                  - Root health check
 - GET  /health            - Detailed health check
 - POST /api/chat          - Standard RAG chat (complete response)
 - POST /api/chat/stream   - Streaming RAG chat (Server-Sent Events)
+- POST /api/chat/batch    - Answer up to 48 questions in one request
 - POST /api/search        - Direct vector search (no LLM)
+- POST /api/search/batch  - Run up to 48 vector searches in one request
 - GET  /api/parks         - List available parks (placeholder)
+- GET  /api/stats         - Embedding / answer cache hit and miss counters
 
 Date: February 2026
 """
-import json
+import asyncio
+import hashlib
 import logging
 import os
 from contextlib import asynccontextmanager
-from typing import Dict, List, Optional
+from typing import Annotated, Dict, List, Optional
 
+import orjson
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, Field, field_validator
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator
+
+from errors import ContextTooLargeError
 
 # Load environment variables before any LangChain/LangGraph imports
 load_dotenv()
 
-# Configure logging
+# Configure logging (LOG_LEVEL=WARNING in production skips the per-request INFO lines)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 logger = logging.getLogger(__name__)
@@ -50,54 +63,238 @@ logger = logging.getLogger(__name__)
 # ─────────────────────────── Lazy pipeline loader ─────────────────────────────
 
 _rag_pipeline = None
+_rag_lock = asyncio.Lock()
+
+
+def _load_rag_pipeline():
+    """Import the pipeline module (clients, LangGraph graph build) — blocking."""
+    from pipeline import rag_pipeline as rp
+    return rp
 
 
-def get_rag_pipeline():
-    """Load the RAG pipeline on first use to keep startup time under 2 seconds."""
+async def get_rag_pipeline():
+    """
+    Load the RAG pipeline on first use to keep startup time under 2 seconds.
+
+    The lock makes concurrent first requests wait for a single load, and the
+    import runs in a worker thread so the event loop keeps serving meanwhile.
+    """
     global _rag_pipeline
     if _rag_pipeline is None:
-        from pipeline import rag_pipeline as rp
-        _rag_pipeline = rp
+        async with _rag_lock:
+            if _rag_pipeline is None:
+                _rag_pipeline = await asyncio.to_thread(_load_rag_pipeline)
     return _rag_pipeline
 
 
+async def _warmup():
+    """
+    Preload the pipeline and open its provider connections in the background,
+    so the first request skips both the cold load and the TLS handshakes.
+    """
+    try:
+        pipeline = await get_rag_pipeline()
+        await pipeline.warm_up()
+        logger.info("RAG pipeline preloaded")
+    except Exception as e:
+        logger.error("RAG pipeline preload failed: %s", e)
+
+
 # ─────────────────────────── App lifecycle ────────────────────────────────────
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """FastAPI lifespan: log startup / shutdown."""
+    """
+    FastAPI lifespan: start the background pipeline preload, then close the
+    shared HTTP pool and the Qdrant client on shutdown.
+
+    The preload is a task rather than an await so the port still binds
+    immediately for Render's health check.
+    """
+    warmup_task = asyncio.create_task(_warmup())
     logger.info("National Parks Chatbot API started")
     yield
     logger.info("National Parks Chatbot API shutting down")
+    warmup_task.cancel()
+    if _rag_pipeline is not None:
+        from pipeline import aclose_clients
+        await aclose_clients()
 
 
 # ─────────────────────────── FastAPI app ──────────────────────────────────────
 
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+
+    Defined here rather than imported because fastapi.responses.ORJSONResponse
+    is deprecated in recent FastAPI releases and warns on every response.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
 app = FastAPI(
     title="National Parks Chatbot API",
     description="RAG-based chatbot for U.S. National Parks information",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
+# Comma-separated frontend origins, e.g. "https://parks.example.com,http://localhost:3000".
+# The default "*" allows any origin without credentials — browsers reject a
+# credentialed response whose Allow-Origin is a wildcard anyway.
+ALLOWED_ORIGINS = [o.strip() for o in (os.getenv("ALLOWED_ORIGINS") or "*").split(",") if o.strip()]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Restrict to your frontend URL in production
-    allow_credentials=True,
+    allow_origins=ALLOWED_ORIGINS,
+    allow_credentials="*" not in ALLOWED_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
 
+class StreamAwareGZipMiddleware(GZipMiddleware):
+    """
+    GZip responses except the SSE endpoints, whose tokens must be flushed as
+    they are produced — older Starlette releases buffer event streams.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Search results and answers carry full text chunks (5-50KB); they compress 3-5x.
+app.add_middleware(StreamAwareGZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Request bodies larger than this are rejected with 413 before they are read.
+# The batch endpoints carry up to 48 requests / queries, so they get larger caps.
+MAX_BODY_BYTES = 64 * 1024
+_BODY_LIMITS = {
+    "/api/chat/batch": 16 * MAX_BODY_BYTES,
+    "/api/search/batch": 2 * MAX_BODY_BYTES,
+}
+
+
+class BodySizeLimitMiddleware:
+    """
+    Reject requests whose declared Content-Length exceeds the path's limit.
+
+    A Content-Length that is not a non-negative integer gets a 400.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            limit = _BODY_LIMITS.get(scope["path"], MAX_BODY_BYTES)
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    try:
+                        length = int(value)
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        response = ORJSONResponse({"detail": "Invalid Content-Length"}, status_code=400)
+                    elif length > limit:
+                        response = ORJSONResponse({"detail": "Payload too large"}, status_code=413)
+                    else:
+                        break
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(BodySizeLimitMiddleware)
+
+_HEALTH_BODY = orjson.dumps(
+    {"status": "healthy", "message": "All systems operational", "version": "1.0.0"}
+)
+
+
+class HealthCheckMiddleware:
+    """
+    Answer GET /health before the rest of the middleware stack.
+
+    Render polls it every few seconds; a mounted sub-app would still run
+    through CORS and gzip, so the static body is sent from the outermost layer.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/health" and scope["method"] == "GET":
+            await Response(_HEALTH_BODY, media_type="application/json")(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+# Added last so it is the outermost middleware
+app.add_middleware(HealthCheckMiddleware)
+
+
+
+@app.exception_handler(ContextTooLargeError)
+async def context_too_large_handler(request: Request, exc: ContextTooLargeError):
+    """
+    A prompt that cannot fit any context is the caller's to fix: 413 with the reason.
+
+    Registered for the exception class (not folded into the catch-all below)
+    so it is handled inside the middleware stack and keeps its CORS headers.
+    """
+    return ORJSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request: Request, exc: Exception):
+    """
+    Log any unhandled endpoint error and return a generic 500.
+
+    Internal error messages (API keys missing, provider errors) are kept out
+    of the response body.  The streaming endpoint handles its own errors,
+    since its response has already started by the time they occur.
+    """
+    logger.exception("Unhandled error on %s %s", request.method, request.url.path, exc_info=exc)
+    return ORJSONResponse(status_code=500, content={"detail": "Internal server error"})
+
+
 # ─────────────────────────── Request / Response models ────────────────────────
 
+# Input limits — enforced at parse time, before any Cohere / Groq call is made
+MAX_QUESTION_CHARS = 2000
+MAX_HISTORY_CONTENT_CHARS = 4000   # longer history messages are truncated, not rejected
+
+# Shared by all request bodies: unknown fields are dropped, leading/trailing
+# whitespace is stripped during validation, and instances are immutable.
+_REQUEST_CONFIG = ConfigDict(extra="ignore", frozen=True, str_strip_whitespace=True)
+
+
 class Message(BaseModel):
+    model_config = _REQUEST_CONFIG
+
     role: str = Field(..., description="Role: 'user' or 'assistant'")
     content: str = Field(..., description="Message content")
 
+    @field_validator("content")
+    @classmethod
+    def truncate_content(cls, v):
+        return v[:MAX_HISTORY_CONTENT_CHARS]
+
 
 class ChatRequest(BaseModel):
-    question: str = Field(..., description="User question about national parks")
+    model_config = _REQUEST_CONFIG
+
+    question: str = Field(
+        ..., min_length=1, max_length=MAX_QUESTION_CHARS, description="User question about national parks"
+    )
     park_code: Optional[str] = Field(None, description="Optional park code to filter results")
     top_k: Optional[int] = Field(5, description="Number of context chunks to retrieve", ge=1, le=10)
     conversation_history: Optional[List[Message]] = Field(
@@ -113,11 +310,41 @@ class ChatRequest(BaseModel):
         return v
 
 
+class BatchChatRequest(BaseModel):
+    model_config = _REQUEST_CONFIG
+
+    items: List[ChatRequest] = Field(
+        ..., min_length=1, max_length=48, description="Chat requests to answer (up to 48)"
+    )
+
+
 class SearchRequest(BaseModel):
-    query: str = Field(..., description="Search query")
+    model_config = _REQUEST_CONFIG
+
+    query: str = Field(..., min_length=1, max_length=MAX_QUESTION_CHARS, description="Search query")
     park_code: Optional[str] = Field(None, description="Optional park code to filter results")
     top_k: Optional[int] = Field(10, description="Number of results to return", ge=1, le=20)
+    hnsw_ef: Optional[int] = Field(
+        None, description="HNSW search breadth: higher for recall, lower for latency", ge=8, le=512
+    )
+
 
+class BatchSearchRequest(BaseModel):
+    model_config = _REQUEST_CONFIG
+
+    queries: List[Annotated[str, Field(min_length=1, max_length=MAX_QUESTION_CHARS)]] = Field(
+        ..., min_length=1, max_length=48, description="Search queries (up to 48)"
+    )
+    park_code: Optional[str] = Field(None, description="Optional park code to filter results")
+    top_k: Optional[int] = Field(10, description="Number of results per query", ge=1, le=20)
+    hnsw_ef: Optional[int] = Field(
+        None, description="HNSW search breadth: higher for recall, lower for latency", ge=8, le=512
+    )
+
+
+# Response models document the API schema only: handlers return the pipeline's
+# dicts straight through orjson without validating them, so the pipeline must
+# emit exactly these fields.
 
 class Source(BaseModel):
     park_name: str
@@ -152,11 +379,25 @@ class HealthResponse(BaseModel):
 
 # ─────────────────────────── Helpers ──────────────────────────────────────────
 
+def _etag_response(request: Request, body: bytes, cache_control: str) -> Response:
+    """
+    Send a JSON body with a content-hash ETag, or an empty 304 when the client's
+    If-None-Match already names this exact body.
+    """
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+# Dumps a whole history in one pydantic-core call instead of one per message
+_MESSAGES_ADAPTER = TypeAdapter(List[Message])
+
+
 def _history_to_dicts(messages: Optional[List[Message]]) -> Optional[List[Dict]]:
     """Convert Pydantic Message models to plain dicts for the RAG pipeline."""
-    if not messages:
-        return None
-    return [{"role": m.role, "content": m.content} for m in messages]
+    return _MESSAGES_ADAPTER.dump_python(messages) if messages else None
 
 
 # ─────────────────────────── Endpoints ────────────────────────────────────────
@@ -167,17 +408,26 @@ async def root():
     return {"status": "healthy", "message": "National Parks Chatbot API is running", "version": "1.0.0"}
 
 
-@app.get("/health", response_model=HealthResponse)
+@app.get("/health", response_model=None, responses={200: {"model": HealthResponse}})
 async def health():
-    """Detailed health check — kept intentionally lightweight for Render."""
-    return {"status": "healthy", "message": "All systems operational", "version": "1.0.0"}
+    """
+    Detailed health check — kept intentionally lightweight for Render.
+
+    Normally answered by HealthCheckMiddleware; this route documents it in the
+    OpenAPI schema and serves it if the middleware is removed.
+    """
+    return Response(_HEALTH_BODY, media_type="application/json")
 
 
-@app.post("/api/chat", response_model=ChatResponse)
+@app.post("/api/chat", response_model=None, responses={200: {"model": ChatResponse}})
 async def chat(request: ChatRequest):
     """
     Standard RAG chat endpoint — returns a complete response.
 
+    The pipeline's result dict is already in ChatResponse shape, so it is
+    serialized straight to JSON rather than re-validated and re-encoded on
+    every request; ChatResponse is kept for the OpenAPI schema only.
+
     Example request:
     ```json
     {
@@ -190,18 +440,14 @@ async def chat(request: ChatRequest):
     }
     ```
     """
-    try:
-        pipeline = get_rag_pipeline()
-        result = await pipeline.answer_question(
-            question=request.question,
-            top_k=request.top_k,
-            park_code=request.park_code,
-            conversation_history=_history_to_dicts(request.conversation_history),
-        )
-        return result
-    except Exception as e:
-        logger.error(f"Chat error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    pipeline = await get_rag_pipeline()
+    result = await pipeline.answer_question(
+        question=request.question,
+        top_k=request.top_k,
+        park_code=request.park_code,
+        conversation_history=_history_to_dicts(request.conversation_history),
+    )
+    return ORJSONResponse(result)
 
 
 @app.post("/api/chat/stream")
@@ -209,11 +455,12 @@ async def chat_stream(request: ChatRequest):
     """
     Streaming RAG chat endpoint — returns tokens as Server-Sent Events.
 
-    Uses LangGraph's astream_events to emit each generated token as it is
+    Uses LangGraph's astream to emit each generated token as it is
     produced by the Groq LLM, so the frontend can render the answer
     progressively without waiting for the full response.
 
     SSE event format:
+      data: {"type": "sources", "sources": [...], "num_sources": N}  (before the first token)
       data: {"type": "token",  "content": "<text>"}
       data: {"type": "done",   "sources": [...], "num_sources": N}
       data: {"type": "error",  "message": "<msg>"}   (on exception)
@@ -221,7 +468,7 @@ async def chat_stream(request: ChatRequest):
 
     Example request body is identical to /api/chat.
     """
-    pipeline = get_rag_pipeline()
+    pipeline = await get_rag_pipeline()
     conversation_history = _history_to_dicts(request.conversation_history)
 
     async def event_generator():
@@ -232,48 +479,129 @@ async def chat_stream(request: ChatRequest):
                 park_code=request.park_code,
                 conversation_history=conversation_history,
             ):
-                yield f"data: {json.dumps(event)}\n\n"
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
+        except ContextTooLargeError as e:
+            yield b"data: " + orjson.dumps(
+                {"type": "error", "status": 413, "message": str(e)}
+            ) + b"\n\n"
         except Exception as e:
-            logger.error(f"Streaming error: {e}")
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            logger.error("Streaming error: %s", e)
+            yield b"data: " + orjson.dumps({"type": "error", "message": str(e)}) + b"\n\n"
         finally:
-            yield "data: [DONE]\n\n"
+            yield b"data: [DONE]\n\n"
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 
-@app.post("/api/search", response_model=List[SearchResult])
-async def search(request: SearchRequest):
+@app.post("/api/chat/batch", response_model=None, responses={200: {"model": List[ChatResponse]}})
+async def chat_batch(request: BatchChatRequest):
+    """
+    Batch RAG chat endpoint — answers every item and returns the responses in order.
+
+    The questions are embedded together in one Cohere call and the retrievals
+    and Groq completions run concurrently, so N questions cost roughly one
+    round trip instead of N.  Useful for eval scripts.
+
+    Example request:
+    ```json
+    {"items": [{"question": "Best hikes in Zion?"}, {"question": "When does Glacier open?"}]}
+    ```
+    """
+    pipeline = await get_rag_pipeline()
+    results = await pipeline.answer_many([
+        {
+            "question": item.question,
+            "top_k": item.top_k,
+            "park_code": item.park_code,
+            "conversation_history": _history_to_dicts(item.conversation_history),
+        }
+        for item in request.items
+    ])
+    return ORJSONResponse(results)
+
+
+@app.post("/api/search", response_model=None, responses={200: {"model": List[SearchResult]}})
+async def search(request: SearchRequest, raw_request: Request):
     """
     Direct vector search endpoint — no LLM generation.
 
+    Responses carry an ETag of their content; a client repeating a search with
+    If-None-Match gets an empty 304 when the results haven't changed.
+
     Example request:
     ```json
     {"query": "hiking trails", "top_k": 10}
     ```
     """
-    try:
-        pipeline = get_rag_pipeline()
-        results = await pipeline.search(
-            query=request.query,
-            top_k=request.top_k,
-            park_code=request.park_code,
-        )
-        return results
-    except Exception as e:
-        logger.error(f"Search error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    pipeline = await get_rag_pipeline()
+    results = await pipeline.search(
+        query=request.query,
+        top_k=request.top_k,
+        park_code=request.park_code,
+        hnsw_ef=request.hnsw_ef,
+    )
+    return _etag_response(raw_request, orjson.dumps(results), "no-cache")
+
+
+@app.post(
+    "/api/search/batch", response_model=None, responses={200: {"model": List[List[SearchResult]]}}
+)
+async def search_batch(request: BatchSearchRequest):
+    """
+    Batch vector search endpoint — one result list per query, in order.
+
+    The queries are embedded in one Cohere call and searched in one Qdrant
+    batch request.
+
+    Example request:
+    ```json
+    {"queries": ["hiking trails", "campgrounds"], "park_code": "zion", "top_k": 5}
+    ```
+    """
+    pipeline = await get_rag_pipeline()
+    results = await pipeline.search_many(
+        queries=request.queries,
+        top_k=request.top_k,
+        park_code=request.park_code,
+        hnsw_ef=request.hnsw_ef,
+    )
+    return ORJSONResponse(results)
+
+
+@app.get("/api/stats")
+async def stats():
+    """Cache counters for this worker process (hits, misses, current sizes)."""
+    pipeline = await get_rag_pipeline()
+    return ORJSONResponse(pipeline.cache_stats())
+
+
+_PARKS_BODY = orjson.dumps({"message": "Parks listing endpoint - to be implemented", "parks": []})
 
 
 @app.get("/api/parks")
-async def list_parks():
-    """List available parks (placeholder — would query Qdrant for unique codes)."""
-    return {"message": "Parks listing endpoint - to be implemented", "parks": []}
+async def list_parks(request: Request):
+    """
+    List available parks (placeholder — would query Qdrant for unique codes).
+
+    The listing is static, so it is served with an ETag and a 5-minute
+    Cache-Control; revalidations get an empty 304.
+    """
+    return _etag_response(request, _PARKS_BODY, "public, max-age=300")
 
 
 # ─────────────────────────── Entry point ──────────────────────────────────────
 
 # Run with: uvicorn main:app --reload --host 0.0.0.0 --port 8000
+# or `python main.py`, which uses uvloop + httptools (both ship with
+# uvicorn[standard]) and WEB_CONCURRENCY worker processes.  Each worker loads
+# its own pipeline, so keep the default of 1 on Render's 512MB free tier.
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
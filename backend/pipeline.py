@@ -2,7 +2,8 @@
 RAG Pipeline — National Parks Chatbot
 
 Implements the full retrieval-augmented generation pipeline using native
-LangChain integrations: CohereEmbeddings, QdrantVectorStore, and ChatGroq.
+LangChain integrations (CohereEmbeddings and ChatGroq) plus Qdrant's async
+client for vector search.
 LangGraph orchestrates the pipeline as a directed graph of nodes.
 
 Graph flow:
@@ -12,33 +13,152 @@ Graph flow:
             │     └─> retrieve
             └─> retrieve        (direct, when no history)
                   ├─> generate    (context found)
-                  └─> no_results  (no context found)
-                        └─> END
+                  │     └─> END
+                  └─> END         (no context found: fallback answer set by retrieve)
 
 Author: Built with Claude Code
 Date: February 2026
 """
+import abc
+import asyncio
+import functools
+import hashlib
+import io
 import logging
+import operator
 import os
-from typing import Dict, List, Optional
-
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+import cohere
+import httpx
+import numpy as np
+from cohere.errors import TooManyRequestsError
+from groq import RateLimitError
 from langchain_cohere import CohereEmbeddings
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.rate_limiters import InMemoryRateLimiter
 from langchain_groq import ChatGroq
-from langchain_qdrant import QdrantVectorStore
+from langgraph.config import get_stream_writer
 from langgraph.graph import END, START, StateGraph
-from qdrant_client import QdrantClient
-from qdrant_client.models import FieldCondition, Filter, MatchValue
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    FieldCondition,
+    Filter,
+    MatchValue,
+    PayloadSelectorInclude,
+    QuantizationSearchParams,
+    QueryRequest,
+    ScoredPoint,
+    SearchParams,
+)
 from typing_extensions import TypedDict
 
+from errors import ContextTooLargeError
+
 logger = logging.getLogger(__name__)
 
 # ─────────────────────────── Constants ────────────────────────────────────────
 
+# Credentials, read and stripped once at import (main.py runs load_dotenv()
+# before the pipeline is imported).  Stray whitespace from copy-pasted keys is
+# a common cause of 401s, hence the strip.
+_COHERE_API_KEY = os.getenv("COHERE_API_KEY", "").strip() or None
+_GROQ_API_KEY = os.getenv("GROQ_API_KEY", "").strip() or None
+_QDRANT_URL = os.getenv("QDRANT_URL", "").strip() or None
+_QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "").strip() or None
+
 MODEL = "llama-3.3-70b-versatile"
+EMBEDDING_MODEL = "embed-english-v3.0"
 COLLECTION = "national_parks"
 
+# Qdrant transport: gRPC (port 6334) skips JSON encoding on every search; off by
+# default so deployments that only expose the REST port keep working.  The
+# pool size caps REST connections / gRPC channels to Qdrant.
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").strip().lower() in ("1", "true", "yes")
+QDRANT_POOL_SIZE = 32
+
+# Provider hosts pre-connected by warm_up() so the first request skips the handshakes
+COHERE_BASE_URL = "https://api.cohere.com"
+GROQ_BASE_URL = "https://api.groq.com"
+
+# Query embeddings kept in memory so repeated questions skip the Cohere call
+EMBED_CACHE_SIZE = 4096
+# "int8" stores cached vectors as scalar-quantized codes (4x smaller); "none" keeps float32
+EMBED_CACHE_QUANTIZATION = os.getenv("EMBED_CACHE_QUANTIZATION", "none").strip().lower()
+
+# Complete answers kept in memory so a repeated question skips the whole
+# Cohere + Qdrant + Groq chain; entries expire after ANSWER_CACHE_TTL seconds
+# (0 disables the cache).
+ANSWER_CACHE_SIZE = 2048
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Semantic answer cache: a history-less question whose embedding has cosine
+# similarity >= SEMANTIC_CACHE_THRESHOLD with an answered one (same park_code
+# and top_k) reuses that answer.  0 disables it; 0.97 catches rephrasings.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0"))
+SEMANTIC_CACHE_SIZE = 1024
+# Retrieval results are reused the same way for any search whose query
+# embedding is at least this similar to a recent one with the same park
+# filter, top_k and hnsw_ef; skips the Qdrant round trip.  0 disables it;
+# 0.95 catches rephrasings.  Cached results can lag a re-ingested collection
+# by up to SEARCH_CACHE_TTL seconds.
+SEARCH_CACHE_THRESHOLD = float(os.getenv("SEARCH_CACHE_THRESHOLD", "0"))
+SEARCH_CACHE_SIZE = 512
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+
+# Cohere accepts at most 96 texts per embed call; larger inputs are split into
+# sub-batches that are sent concurrently, at most COHERE_MAX_IN_FLIGHT at a time.
+COHERE_BATCH_SIZE = 96
+COHERE_MAX_IN_FLIGHT = int(os.getenv("COHERE_MAX_IN_FLIGHT", "3"))
+# Concurrent single-query embeds arriving within this window share one Cohere call
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "10"))
+
+# Optional second-stage re-rank with Cohere Rerank (e.g. "rerank-english-v3.0"):
+# retrieval over-fetches top_k * RERANK_OVERFETCH candidates and keeps the top_k
+# the reranker orders first.  Off by default — it costs one more Cohere call per query.
+RERANK_MODEL = os.getenv("RERANK_MODEL", "").strip() or None
+RERANK_OVERFETCH = int(os.getenv("RERANK_OVERFETCH", "4"))
+
+# Retry policy for 429 responses from Cohere / Groq (see retry_on_rate_limit)
+RATE_LIMIT_MAX_ATTEMPTS = 4
+RATE_LIMIT_BASE_DELAY = 0.5   # seconds
+RATE_LIMIT_MAX_DELAY = 30.0   # seconds
+
+# Prompt size limit for generate_node.  Defaults to the model's 128K window less
+# room for the answer; lower PROMPT_TOKEN_BUDGET to your Groq tier's
+# tokens-per-minute quota to avoid "413 Request too large" errors.
+MODEL_CONTEXT_TOKENS = 131072
+RESPONSE_TOKEN_RESERVE = 1024
+PROMPT_TOKEN_BUDGET = int(os.getenv(
+    "PROMPT_TOKEN_BUDGET", str(MODEL_CONTEXT_TOKENS - RESPONSE_TOKEN_RESERVE)
+))
+
+# Conversation history sent to the LLM: at most the newest HISTORY_MAX_MESSAGES
+# messages, further cut to HISTORY_TOKEN_BUDGET tokens.  Park detection still
+# scans the full history.
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "8"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+
+# Concurrent outbound calls per provider (Cohere's cap is COHERE_MAX_IN_FLIGHT).
+# Past a few in-flight requests per-call latency climbs faster than throughput.
+GROQ_MAX_IN_FLIGHT = int(os.getenv("GROQ_MAX_IN_FLIGHT", "8"))
+QDRANT_MAX_IN_FLIGHT = int(os.getenv("QDRANT_MAX_IN_FLIGHT", "4"))
+# Concurrent searches arriving within this window share one Qdrant batch query
+SEARCH_BATCH_WINDOW_MS = float(os.getenv("SEARCH_BATCH_WINDOW_MS", "5"))
+# HNSW candidate-list size for an unfiltered search: larger explores more of the
+# graph (better recall, more work); Qdrant's default is the collection's
+# ef_construct.  Park-filtered searches use half of it (see _choose_ef).
+QDRANT_HNSW_EF = int(os.getenv("QDRANT_HNSW_EF", "128"))
+QDRANT_SEARCH_BATCH_SIZE = 64
+
+# Client-side pacing, matched to the free-tier quotas (calls per minute)
+COHERE_REQUESTS_PER_MINUTE = int(os.getenv("COHERE_REQUESTS_PER_MINUTE", "100"))
+GROQ_REQUESTS_PER_MINUTE = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+
 SYSTEM_PROMPT = """You are a helpful and knowledgeable National Parks expert assistant. Your role is to help visitors learn about U.S. National Parks, including their features, activities, wildlife, history, and visitor information.
 
 Guidelines:
@@ -50,6 +170,48 @@ Guidelines:
 - When answering follow-up questions, reference previous parts of the conversation naturally
 - If a user's question refers to "it" or "there", use conversation context to understand what they mean"""
 
+# Park-scoped prompt pieces — formatted once per park by _park_prompts().
+# The system prompt drops SYSTEM_PROMPT's "reference prior turns" language,
+# which can prime the LLM to draw from contaminated history.  The park name
+# comes last so every park shares the same leading text.  Nothing here relies
+# on that: Groq has no prompt cache to opt into, and caches prefixes on its
+# own only for some models (not MODEL).  A model or provider that does would
+# reuse the shared rules across parks.
+PARK_SYSTEM_PROMPT = (
+    "You are a helpful National Parks expert assistant.\n\n"
+    "STRICT RULES — follow these above all else:\n"
+    "1. Answer ONLY about the park named below.\n"
+    "2. Use ONLY the provided context. No outside knowledge.\n"
+    "3. Do NOT mention, compare, or reference any other national park.\n"
+    "4. Be friendly and accurate. Prioritize visitor safety when relevant.\n\n"
+    "This conversation is specifically about {park_name}."
+)
+
+# Scope instruction placed BEFORE the context (so the LLM reads it first) ...
+PARK_PRE_CONTEXT = (
+    "SCOPE: This conversation is about {park_name}.\n"
+    "Any pronoun such as 'there', 'it', or 'the park' refers to {park_name}.\n"
+    "Read only the context below. Ignore any knowledge about other parks.\n\n"
+)
+
+# ... and AFTER the question, where LLMs weight instructions most heavily.
+PARK_POST_QUESTION = (
+    "\n\nRULES:\n"
+    "1. Answer ONLY about {park_name}.\n"
+    "2. Use ONLY the context provided above — do not add outside knowledge.\n"
+    "3. Do NOT mention, compare, or reference any other national park.\n"
+    "4. If the context does not contain enough information, say so rather "
+    "than pulling in details from other parks."
+)
+
+GENERAL_POST_QUESTION = "\n\nAnswer using only the context provided above."
+
+# Returned without an LLM call when retrieval finds nothing
+NO_RESULTS_ANSWER = (
+    "I couldn't find relevant information to answer your question. "
+    "Please try rephrasing or ask about specific national parks."
+)
+
 # Park name → 4-letter code (used for detection)
 PARK_MAPPINGS: Dict[str, str] = {
     'yellowstone': 'yell',
@@ -75,6 +237,39 @@ PARK_MAPPINGS: Dict[str, str] = {
     'crater lake': 'crla',
 }
 
+# Every park name as one alternation (longest first, so "great smoky mountains"
+# wins over "great smoky"): a single regex pass replaces a substring scan per park.
+# Case-insensitive so messages are scanned as-is, without a lowercased copy.
+_PARK_NAME_RE = re.compile(
+    "|".join(map(re.escape, sorted(PARK_MAPPINGS, key=len, reverse=True))),
+    re.IGNORECASE,
+)
+
+# Pronouns and back-references that only make sense given earlier turns
+_NEEDS_REWRITE_RE = re.compile(
+    r"\b(it|its|there|here|that|this|those|these|them|they|their|the park|the trail)\b",
+    re.IGNORECASE,
+)
+
+# References that can only mean the active park: "the park", and a locative
+# "there" (not the existential "is there" / "there are")
+_PARK_REF_RE = re.compile(
+    r"\bthe park\b|(?<!\bis )(?<!\bare )(?<!\bwas )(?<!\bwere )\bthere\b(?!\s+(?:is|are|was|were)\b|'s)",
+    re.IGNORECASE,
+)
+# "there" as a destination or origin ("get there", "drive from there"), where
+# "in <park>" would make a broken query; those questions go to the LLM
+_MOTION_THERE_RE = re.compile(
+    r"\b(?:get|gets|getting|got|go|goes|going|went|drive|drives|driving|drove|"
+    r"fly|flies|flying|flew|travel\w*|head\w*|to|from)\s+there\b",
+    re.IGNORECASE,
+)
+# Longer follow-ups are left to the LLM rewrite
+TEMPLATE_REWRITE_MAX_WORDS = 20
+# A rewrite whose embedding is at least this cosine-similar to the original
+# question's reuses the speculative retrieval instead of searching again
+SPECULATIVE_REUSE_SIMILARITY = float(os.getenv("SPECULATIVE_REUSE_SIMILARITY", "0.95"))
+
 # 4-letter code → full park name (used for display and prompts)
 CODE_TO_NAME: Dict[str, str] = {
     'yell': 'Yellowstone National Park',
@@ -122,45 +317,843 @@ REWRITE_PROMPT = ChatPromptTemplate.from_messages([
 
 # ─────────────────────────── Lazy client initializers ─────────────────────────
 
+_http_client: Optional[httpx.AsyncClient] = None
 _embeddings: Optional[CohereEmbeddings] = None
-_qdrant_client: Optional[QdrantClient] = None
-_vectorstore: Optional[QdrantVectorStore] = None
+_qdrant_client: Optional[AsyncQdrantClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """
+    One HTTP/2 keep-alive pool shared by the async Cohere and Groq clients.
+
+    Each provider otherwise opens its own pool, paying a TCP + TLS handshake
+    on a cold worker; sharing keeps warm connections on the hot path.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=16),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+    return _http_client
+
+
+async def aclose_clients() -> None:
+    """Close the shared HTTP pool and the Qdrant client (called from the FastAPI lifespan shutdown)."""
+    global _http_client, _qdrant_client
+    if _qdrant_client is not None:
+        await _qdrant_client.close()
+        _qdrant_client = None
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        # Cached ChatGroq instances hold the closed pool
+        _get_chat_groq.cache_clear()
 
 
 def _get_embeddings() -> CohereEmbeddings:
     global _embeddings
     if _embeddings is None:
-        api_key = os.getenv("COHERE_API_KEY", "").strip()
-        if not api_key:
+        if not _COHERE_API_KEY:
             raise ValueError("COHERE_API_KEY environment variable not set")
         _embeddings = CohereEmbeddings(
-            model="embed-english-v3.0",
-            cohere_api_key=api_key,
+            model=EMBEDDING_MODEL,
+            cohere_api_key=_COHERE_API_KEY,
+            # No LangChain-level retries: its backoff ignores Retry-After.
+            # Calls go through async_client with the SDK's retries off too
+            # (_COHERE_NO_RETRY), and retry_on_rate_limit handles 429s.
+            max_retries=0,
+        )
+        # CohereEmbeddings always builds its own async client, so swap in one
+        # that uses the shared pool afterwards, with the same base_url, timeout
+        # and client name.  With no request_timeout set, requests take the
+        # pool's timeout (60s) rather than the SDK's standalone default (300s).
+        _embeddings.async_client = cohere.AsyncClient(
+            _COHERE_API_KEY,
+            base_url=_embeddings.base_url,
+            timeout=_embeddings.request_timeout,
+            client_name=_embeddings.user_agent,
+            httpx_client=_get_http_client(),
         )
     return _embeddings
 
 
-def _get_qdrant_client() -> QdrantClient:
+@functools.lru_cache(maxsize=8)
+def _get_chat_groq(
+    temperature: float, max_tokens: Optional[int] = None, streaming: bool = False
+) -> ChatGroq:
+    """One ChatGroq per configuration, reused across requests."""
+    return ChatGroq(
+        model=MODEL,
+        api_key=_GROQ_API_KEY,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        streaming=streaming,
+        rate_limiter=_groq_rate_limiter,
+        http_async_client=_get_http_client(),
+        # Rate limits are retried by retry_on_rate_limit (honoring Retry-After);
+        # SDK retries underneath it would multiply every 429.
+        max_retries=0,
+    )
+
+
+def _get_qdrant_client() -> AsyncQdrantClient:
+    """
+    Async Qdrant client, so searches run on the event loop rather than in
+    worker threads.  REST goes over a pooled HTTP/2 connection; gRPC is used
+    instead when QDRANT_PREFER_GRPC is set.
+    """
     global _qdrant_client
     if _qdrant_client is None:
-        url = os.getenv("QDRANT_URL", "").strip()
-        api_key = os.getenv("QDRANT_API_KEY", "").strip()
-        if not url or not api_key:
+        if not _QDRANT_URL or not _QDRANT_API_KEY:
             raise ValueError("QDRANT_URL and QDRANT_API_KEY must be set")
-        _qdrant_client = QdrantClient(url=url, api_key=api_key)
+        _qdrant_client = AsyncQdrantClient(
+            url=_QDRANT_URL,
+            api_key=_QDRANT_API_KEY,
+            prefer_grpc=QDRANT_PREFER_GRPC,
+            pool_size=QDRANT_POOL_SIZE,
+            http2=True,
+            timeout=30,
+        )
     return _qdrant_client
 
 
-def _get_vectorstore() -> QdrantVectorStore:
-    global _vectorstore
-    if _vectorstore is None:
-        _vectorstore = QdrantVectorStore(
-            client=_get_qdrant_client(),
-            collection_name=COLLECTION,
-            embedding=_get_embeddings(),
-            content_payload_key="text",  # matches payload key used when building the index
+async def ensure_payload_index(field_name: str = "park_code", field_type: str = "keyword") -> None:
+    """
+    Create a payload index on field_name if the collection doesn't have one.
+
+    Park-scoped searches filter on park_code; with a keyword index Qdrant
+    applies the filter while traversing the HNSW graph instead of rejecting the
+    query with "Index required but not found".  Same index as
+    data_ingestion/create_index.py, created here so a fresh collection works
+    without the manual step.
+    """
+    client = _get_qdrant_client()
+    collection = await client.get_collection(COLLECTION)
+    if field_name in (collection.payload_schema or {}):
+        return
+    await client.create_payload_index(
+        collection_name=COLLECTION,
+        field_name=field_name,
+        field_schema=field_type,
+        wait=True,
+    )
+    # A missing index means a new or rebuilt collection: drop stale results
+    _search_cache.clear()
+    _semantic_cache.clear()
+    _answer_cache.clear()
+    logger.info("Created %s payload index on '%s'", field_type, field_name)
+
+
+async def _warm_qdrant() -> None:
+    """
+    Qdrant warm-up: ensure the park_code index, then run one throwaway search
+    so the REST pool / gRPC channel is open and the server has the HNSW graph
+    and quantized vectors in memory before the first user query.
+    """
+    started = time.perf_counter()
+    await ensure_payload_index("park_code", field_type="keyword")
+    client = _get_qdrant_client()
+    info = await client.get_collection(COLLECTION)
+    dim = info.config.params.vectors.size
+    await client.query_points(
+        collection_name=COLLECTION,
+        query=[1.0] + [0.0] * (dim - 1),
+        search_params=_search_params(QDRANT_HNSW_EF),
+        limit=1,
+        with_payload=False,
+    )
+    logger.info(
+        "Qdrant collection '%s' ready (%d points) in %.0f ms",
+        COLLECTION, info.points_count or 0, (time.perf_counter() - started) * 1000,
+    )
+
+
+async def _warm_connections() -> None:
+    """
+    Open every provider connection ahead of the first request.
+
+    A probe search opens the Qdrant connection and loads its index, and the
+    park_code payload index is created if it is missing; a HEAD preflight to
+    Cohere and Groq through the shared pool leaves a TLS session to each in
+    keep-alive.  Best-effort: failures are logged, never raised.
+    """
+    http = _get_http_client()
+    results = await asyncio.gather(
+        _warm_qdrant(),
+        http.head(COHERE_BASE_URL),
+        http.head(GROQ_BASE_URL),
+        return_exceptions=True,
+    )
+    for step, result in zip(("qdrant", "cohere", "groq"), results):
+        if isinstance(result, Exception):
+            logger.warning("Connection warm-up for %s failed: %s", step, result)
+
+
+# ─────────────────────────── Rate-limit retries ───────────────────────────────
+
+_RATE_LIMIT_ERRORS = (TooManyRequestsError, RateLimitError)
+
+# Groq puts its recommendation in the message: "Please try again in 1m2.5s"
+_TRY_AGAIN_RE = re.compile(r"try again in (?:(\d+)m)?(\d+(?:\.\d+)?)s", re.IGNORECASE)
+
+
+def _retry_after_seconds(exc: Exception) -> Optional[float]:
+    """Return the server-recommended wait for a rate-limit error, if it gave one."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or getattr(exc, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+
+    match = _TRY_AGAIN_RE.search(str(exc))
+    if match:
+        minutes, seconds = match.groups()
+        return int(minutes or 0) * 60 + float(seconds)
+    return None
+
+
+def _rate_limit_delay(exc: Exception, attempt: int, base: float, cap: float) -> float:
+    """Honor the server's Retry-After when present, else use jittered exponential backoff."""
+    retry_after = _retry_after_seconds(exc)
+    if retry_after is not None:
+        return min(cap, retry_after)
+    return min(cap, base * 2 ** attempt) + random.uniform(0, 0.25)
+
+
+def retry_on_rate_limit(
+    max_attempts: int = RATE_LIMIT_MAX_ATTEMPTS,
+    base: float = RATE_LIMIT_BASE_DELAY,
+    cap: float = RATE_LIMIT_MAX_DELAY,
+):
+    """
+    Retry a Cohere / Groq call when the provider answers 429 Too Many Requests.
+
+    Works on both sync and async functions.  Any other exception propagates
+    immediately; the last rate-limit error is re-raised once max_attempts is
+    reached.
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                for attempt in range(max_attempts):
+                    try:
+                        return await func(*args, **kwargs)
+                    except _RATE_LIMIT_ERRORS as e:
+                        if attempt == max_attempts - 1:
+                            raise
+                        delay = _rate_limit_delay(e, attempt, base, cap)
+                        logger.warning("%s rate limited, retrying in %.2fs", func.__name__, delay)
+                        await asyncio.sleep(delay)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            for attempt in range(max_attempts):
+                try:
+                    return func(*args, **kwargs)
+                except _RATE_LIMIT_ERRORS as e:
+                    if attempt == max_attempts - 1:
+                        raise
+                    delay = _rate_limit_delay(e, attempt, base, cap)
+                    logger.warning("%s rate limited, retrying in %.2fs", func.__name__, delay)
+                    time.sleep(delay)
+        return sync_wrapper
+
+    return decorator
+
+
+def _per_minute_rate_limiter(requests_per_minute: int) -> InMemoryRateLimiter:
+    """
+    Token bucket holding one minute of quota, refilled at the provider's rate.
+
+    The bucket starts full so an idle server dispatches immediately; calls are
+    only held back once a burst would exceed the per-minute quota, instead of
+    being sent and 429'd.
+    """
+    limiter = InMemoryRateLimiter(
+        requests_per_second=requests_per_minute / 60,
+        max_bucket_size=requests_per_minute,
+    )
+    # InMemoryRateLimiter starts empty and only starts refilling on its first
+    # acquire, so max_bucket_size alone would make the first call after
+    # startup wait a full refill interval (2s at Groq's 30/min) and a burst
+    # be paced from zero.  There is no constructor option for the initial
+    # level, so set the bucket's counter directly; requirements.txt pins
+    # langchain-core below 2.0 for this attribute, and
+    # test_per_minute_rate_limiter_starts_full guards it.
+    limiter.available_tokens = requests_per_minute
+    return limiter
+
+
+_cohere_rate_limiter = _per_minute_rate_limiter(COHERE_REQUESTS_PER_MINUTE)
+_groq_rate_limiter = _per_minute_rate_limiter(GROQ_REQUESTS_PER_MINUTE)
+
+
+# Bounds concurrent Groq calls across all in-flight requests in this process.
+_groq_semaphore = asyncio.Semaphore(GROQ_MAX_IN_FLIGHT)
+
+
+@retry_on_rate_limit()
+async def _ainvoke_llm(runnable, llm_input):
+    """Invoke a Groq-backed runnable on the async client, retrying on rate limits."""
+    async with _groq_semaphore:
+        return await runnable.ainvoke(llm_input)
+
+
+@retry_on_rate_limit()
+async def _astream_llm(llm, messages) -> str:
+    """
+    Stream a Groq completion and return the joined answer.
+
+    Each chunk is surfaced to the graph's "messages" stream as Groq produces it, so the SSE
+    endpoint forwards tokens without waiting for the full completion.  A 429
+    arrives before the first token, so retrying the whole call is safe.
+    """
+    parts = []
+    async with _groq_semaphore:
+        async for chunk in llm.astream(messages):
+            parts.append(chunk.content)
+    return "".join(parts)
+
+
+# ─────────────────────────── Query embedding ──────────────────────────────────
+
+# Bounds concurrent Cohere calls across all in-flight requests in this process.
+_cohere_semaphore = asyncio.Semaphore(COHERE_MAX_IN_FLIGHT)
+
+# The Cohere SDK retries 429s and 5xx twice on its own unless told not to, per
+# call; retry_on_rate_limit is the only retry policy, so every call passes this.
+_COHERE_NO_RETRY = {"max_retries": 0}
+
+
+@retry_on_rate_limit()
+async def _aembed_batch(texts: List[str]) -> np.ndarray:
+    """Embed one sub-batch (at most COHERE_BATCH_SIZE texts) of search queries."""
+    await _cohere_rate_limiter.aacquire()
+    async with _cohere_semaphore:
+        # Called on the SDK client directly: CohereEmbeddings.aembed() has no way
+        # to pass request options, and would convert every float to a list first
+        response = await _get_embeddings().async_client.embed(
+            model=EMBEDDING_MODEL,
+            texts=texts,
+            input_type="search_query",
+            embedding_types=["float"],
+            request_options=_COHERE_NO_RETRY,
+        )
+    return np.asarray(response.embeddings.float_, dtype=np.float32)
+
+
+def quantize_int8(vector: np.ndarray) -> Tuple[np.ndarray, np.float32]:
+    """Scalar-quantize a float vector to int8 codes plus one float32 scale."""
+    scale = np.float32(np.abs(vector).max() / 127)
+    if not scale:
+        return np.zeros(vector.shape, dtype=np.int8), np.float32(1.0)
+    codes = np.round(vector / scale).astype(np.int8)
+    return codes, scale
+
+
+def dequantize_int8(codes: np.ndarray, scale: np.float32) -> np.ndarray:
+    """Inverse of quantize_int8 (up to rounding error)."""
+    return codes.astype(np.float32) * scale
+
+
+# float32 vectors take ~4KB each vs ~28KB as a list of Python floats; with
+# EMBED_CACHE_QUANTIZATION=int8 they are stored as (codes, scale) at ~1KB each
+# and dequantized only when handed back to the caller.
+_embed_cache: OrderedDict = OrderedDict()
+
+
+def _embed_cache_key(text: str) -> bytes:
+    """
+    Fingerprint of (model, input type, normalized text) identifying a query embedding.
+
+    Normalization lowercases and collapses all whitespace runs, so "Zion  hikes"
+    and "zion hikes\n" share one cache entry.
+    """
+    normalized = " ".join(text.lower().split())
+    return hashlib.blake2b(
+        f"{EMBEDDING_MODEL}|search_query|{normalized}".encode()
+    ).digest()
+
+
+# Cache effectiveness, reported by RAGPipeline.cache_stats(): lookups served
+# from each cache, queries that had to be embedded by Cohere, and answers that
+# had to be generated.
+_cache_counters: Dict[str, int] = dict.fromkeys(
+    ("embed_hits", "embed_misses", "answer_hits", "answer_misses", "semantic_hits", "search_hits"),
+    0,
+)
+
+
+def _embed_cache_get(key: bytes) -> Optional[np.ndarray]:
+    entry = _embed_cache.get(key)
+    if entry is None:
+        return None
+    _cache_counters["embed_hits"] += 1
+    _embed_cache.move_to_end(key)
+    if isinstance(entry, tuple):
+        return dequantize_int8(*entry)
+    return entry
+
+
+def _embed_cache_put(key: bytes, vector: np.ndarray) -> None:
+    _embed_cache[key] = quantize_int8(vector) if EMBED_CACHE_QUANTIZATION == "int8" else vector
+    _embed_cache.move_to_end(key)
+    if len(_embed_cache) > EMBED_CACHE_SIZE:
+        _embed_cache.popitem(last=False)
+
+
+async def _aembed_queries(texts: List[str]) -> np.ndarray:
+    """
+    Embed search queries with Cohere's async client without blocking the event loop.
+
+    Queries already in the LRU cache are served from memory; only the misses
+    are sent to Cohere, split into sub-batches of COHERE_BATCH_SIZE and
+    embedded concurrently.  Returns a float32 matrix of shape (len(texts), dim)
+    in the same order as the input.
+    """
+    keys = [_embed_cache_key(text) for text in texts]
+    vectors = [_embed_cache_get(key) for key in keys]
+
+    # One Cohere input per distinct uncached query
+    misses = {key: text for key, text, vector in zip(keys, texts, vectors) if vector is None}
+    if misses:
+        _cache_counters["embed_misses"] += len(misses)
+        miss_texts = list(misses.values())
+        batches = [
+            miss_texts[i:i + COHERE_BATCH_SIZE]
+            for i in range(0, len(miss_texts), COHERE_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*(_aembed_batch(batch) for batch in batches))
+        embedded = dict(zip(misses, (vector for batch in results for vector in batch)))
+        for key, vector in embedded.items():
+            _embed_cache_put(key, vector)
+        vectors = [vector if vector is not None else embedded[key]
+                   for key, vector in zip(keys, vectors)]
+
+    return np.asarray(vectors, dtype=np.float32)
+
+
+class _MicroBatcher(abc.ABC):
+    """
+    Coalesce concurrent single-item calls into one batched provider call.
+
+    Each caller queues (item, future) and awaits the future.  The queue is
+    flushed flush_after_ms after the first pending item arrives, or as soon
+    as max_batch items are waiting, with a single _process call whose results
+    are handed back to the individual futures.  Under concurrent load this
+    amortizes the per-call HTTP overhead and rate-limit budget across
+    requests, the same way continuous batching does for LLM serving.
+    """
+
+    def __init__(self, flush_after_ms: float, max_batch: int):
+        self.flush_after = flush_after_ms / 1000
+        self.max_batch = max_batch
+        self._pending: List[Tuple[object, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()  # strong refs so in-flight flushes aren't GC'd
+
+    async def _submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_after, self._flush)
+        return await future
+
+    @abc.abstractmethod
+    async def _process(self, items: list) -> list:
+        """One provider call for items; returns one result per item, in order."""
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[object, asyncio.Future]]) -> None:
+        try:
+            results = await self._process([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class _QueryEmbedBatcher(_MicroBatcher):
+    """Concurrent single-query embeds share one Cohere call."""
+
+    def __init__(self, flush_after_ms: float = EMBED_BATCH_WINDOW_MS, max_batch: int = COHERE_BATCH_SIZE):
+        super().__init__(flush_after_ms, max_batch)
+
+    async def embed(self, text: str) -> np.ndarray:
+        return await self._submit(text)
+
+    async def _process(self, texts: List[str]) -> List[np.ndarray]:
+        return await _aembed_queries(texts)
+
+
+_query_batcher = _QueryEmbedBatcher()
+
+# Embeds currently in flight, by cache key, so a repeat of the same query joins
+# the pending Cohere call instead of issuing another one.
+_embed_inflight: Dict[bytes, asyncio.Future] = {}
+
+
+async def _aembed_query(text: str) -> np.ndarray:
+    """
+    Embed a single search query.
+
+    Cache hits return immediately; a query that is already being embedded
+    awaits that call; other misses go through the micro-batcher so concurrent
+    requests share one Cohere call.
+    """
+    key = _embed_cache_key(text)
+    vector = _embed_cache_get(key)
+    if vector is not None:
+        return vector
+    pending = _embed_inflight.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(_query_batcher.embed(text))
+        _embed_inflight[key] = pending
+        pending.add_done_callback(lambda _: _embed_inflight.pop(key, None))
+    # shield: one caller being cancelled must not cancel the shared embed
+    return await asyncio.shield(pending)
+
+
+# ─────────────────────────── Vector search ────────────────────────────────────
+
+# Bounds concurrent Qdrant batch searches across all in-flight requests in this process.
+_qdrant_semaphore = asyncio.Semaphore(QDRANT_MAX_IN_FLIGHT)
+
+# One park_code filter per known park, built once instead of on every search
+_PARK_FILTERS: Dict[str, Filter] = {
+    code: Filter(must=[FieldCondition(key="park_code", match=MatchValue(value=code))])
+    for code in CODE_TO_NAME
+}
+
+
+def _park_filter(park_code: str) -> Filter:
+    """Filter on park_code; prebuilt for known parks, built on demand otherwise."""
+    park_filter = _PARK_FILTERS.get(park_code)
+    if park_filter is None:
+        park_filter = Filter(must=[FieldCondition(key="park_code", match=MatchValue(value=park_code))])
+    return park_filter
+
+
+class _QdrantSearchBatcher(_MicroBatcher):
+    """Concurrent vector searches share one Qdrant query_batch_points call."""
+
+    def __init__(
+        self, flush_after_ms: float = SEARCH_BATCH_WINDOW_MS, max_batch: int = QDRANT_SEARCH_BATCH_SIZE
+    ):
+        super().__init__(flush_after_ms, max_batch)
+
+    async def search(self, request: QueryRequest) -> List[ScoredPoint]:
+        return await self._submit(request)
+
+    async def _process(self, requests: List[QueryRequest]) -> List[List[ScoredPoint]]:
+        async with _qdrant_semaphore:
+            responses = await _get_qdrant_client().query_batch_points(
+                collection_name=COLLECTION, requests=requests,
+            )
+        return [response.points for response in responses]
+
+
+_search_batcher = _QdrantSearchBatcher()
+
+# With int8 quantization enabled on the collection (data_ingestion/
+# optimize_collection.py), candidates are scored on the quantized vectors and
+# the top limit * oversampling are rescored with the originals.  Ignored by
+# Qdrant for collections without quantization.
+@functools.lru_cache(maxsize=None)
+def _search_params(hnsw_ef: int) -> SearchParams:
+    return SearchParams(
+        hnsw_ef=hnsw_ef,
+        quantization=QuantizationSearchParams(rescore=True, oversampling=2.0),
+    )
+
+
+# The payload fields _retrieve_chunks reads; anything else stored with a point
+# (chunk_index, future additions) stays on the server
+_PAYLOAD_FIELDS = PayloadSelectorInclude(
+    include=["text", "park_code", "park_name", "source_url", "chunk_id"]
+)
+
+
+def _choose_ef(limit: int, has_filter: bool) -> int:
+    """
+    HNSW candidate-list size for a search returning limit points.
+
+    A search scoped to one park ranks a few dozen chunks, so it needs a far
+    shorter candidate list than a search over the whole collection; either
+    way the list stays comfortably longer than the number of results.
+    """
+    return max(limit * 4, QDRANT_HNSW_EF // 2 if has_filter else QDRANT_HNSW_EF)
+
+
+async def _asearch_by_vector(
+    query_vector: np.ndarray,
+    k: int,
+    park_filter: Optional[Filter],
+    hnsw_ef: Optional[int] = None,
+) -> List[ScoredPoint]:
+    """
+    Search Qdrant with a precomputed query vector; returns the scored points with payloads.
+
+    hnsw_ef overrides the _choose_ef default for this search: higher for
+    recall, lower for latency.
+    """
+    if hnsw_ef is None:
+        hnsw_ef = _choose_ef(k, park_filter is not None)
+    return await _search_batcher.search(QueryRequest(
+        query=query_vector.tolist(),
+        filter=park_filter,
+        params=_search_params(hnsw_ef),
+        limit=k,
+        with_payload=_PAYLOAD_FIELDS,
+    ))
+
+
+@retry_on_rate_limit()
+async def _arerank(query: str, points: List[ScoredPoint], top_n: int) -> List[ScoredPoint]:
+    """Re-order points by Cohere Rerank relevance to query and keep the first top_n."""
+    await _cohere_rate_limiter.aacquire()
+    async with _cohere_semaphore:
+        # CohereEmbeddings' async client already sits on the shared HTTP pool
+        response = await _get_embeddings().async_client.rerank(
+            model=RERANK_MODEL,
+            query=query,
+            documents=[p.payload.get("text", "") for p in points],
+            top_n=top_n,
+            request_options=_COHERE_NO_RETRY,
         )
-    return _vectorstore
+    return [points[result.index] for result in response.results]
+
+
+async def _retrieve_chunks(
+    search_query: str,
+    top_k: int,
+    active_park_code: Optional[str],
+    hnsw_ef: Optional[int] = None,
+) -> List[Dict]:
+    """
+    Embed search_query and return the top_k chunks, scoped to a park if given.
+
+    With RERANK_MODEL set, top_k * RERANK_OVERFETCH candidates are fetched and
+    re-ranked, so the prompt keeps its size while recall improves.  If the
+    rerank call fails the candidates keep their vector-similarity order.
+    A near-duplicate of a recent search (see SEARCH_CACHE_THRESHOLD) reuses
+    its chunks without querying Qdrant.
+    """
+    park_filter = _park_filter(active_park_code) if active_park_code else None
+    limit = top_k * RERANK_OVERFETCH if RERANK_MODEL else top_k
+
+    query_vector = await _aembed_query(search_query)
+    scope = (active_park_code, top_k, hnsw_ef)
+    cached = _search_cache.get(query_vector, scope)
+    if cached is not None:
+        _cache_counters["search_hits"] += 1
+        # Fresh dicts per request; the cached ones are shared by later hits
+        return [dict(c) for c in cached]
+    try:
+        points = await _asearch_by_vector(query_vector, limit, park_filter, hnsw_ef)
+    except Exception as e:
+        # Qdrant requires a keyword index on park_code for filtered searches.
+        # warm_up() creates it; if a request beats the warm-up (or the
+        # collection was recreated since), create it now and search again.
+        if active_park_code and "Index required" in str(e):
+            logger.warning("Qdrant park_code index missing — creating it")
+            await ensure_payload_index("park_code", field_type="keyword")
+            points = await _asearch_by_vector(query_vector, limit, park_filter, hnsw_ef)
+        else:
+            raise
+
+    if len(points) > top_k:
+        try:
+            points = await _arerank(search_query, points, top_k)
+        except Exception as e:
+            logger.warning("Rerank failed, keeping vector order: %s", e)
+            points = points[:top_k]
+
+    chunks = [
+        {
+            "id": i,
+            "score": p.score,
+            "text": p.payload.get("text", ""),
+            "park_code": p.payload.get("park_code", ""),
+            "park_name": p.payload.get("park_name", ""),
+            "source_url": p.payload.get("source_url", ""),
+            "chunk_id": p.payload.get("chunk_id", ""),
+        }
+        for i, p in enumerate(points)
+    ]
+    _search_cache.put(query_vector, scope, tuple(dict(c) for c in chunks))
+    return chunks
+
+
+def _template_rewrite(question: str, park_name: str) -> Optional[str]:
+    """
+    Substitute references to the active park with its name, without an LLM call.
+
+    Returns None — leaving the question to the LLM rewrite — when it is long,
+    already names a park, uses "there" as a destination or origin ("how do I
+    get there?"), has anything but exactly one park reference, or still
+    contains another pronoun ("it", "that", ...) whose referent may be
+    something other than the park.
+    """
+    if (
+        len(question.split()) > TEMPLATE_REWRITE_MAX_WORDS
+        or _PARK_NAME_RE.search(question)
+        or _MOTION_THERE_RE.search(question)
+    ):
+        return None
+    rewritten, count = _PARK_REF_RE.subn(
+        lambda m: park_name if m.group().lower() == "the park" else f"in {park_name}",
+        question,
+    )
+    if count != 1 or _NEEDS_REWRITE_RE.search(rewritten):
+        return None
+    return rewritten
+
+
+def _query_norm(text: str) -> str:
+    """Case/whitespace/trailing-punctuation-insensitive form for comparing queries."""
+    return " ".join(text.lower().split()).rstrip("?.! ")
+
+
+async def _queries_equivalent(original: str, rewritten: str) -> bool:
+    """
+    True if the rewrite is close enough to the original to reuse its retrieval.
+
+    Both embeddings are needed anyway (the original's by the speculative
+    retrieval, the rewrite's by retrieve_node otherwise), so the check
+    costs no extra Cohere call.
+    """
+    a, b = await asyncio.gather(_aembed_query(original), _aembed_query(rewritten))
+    similarity = float(a @ b) / float(np.linalg.norm(a) * np.linalg.norm(b))
+    return similarity >= SPECULATIVE_REUSE_SIMILARITY
+
+
+def _discard_task(task: asyncio.Future) -> None:
+    """Cancel a speculative task, consuming its exception if it already failed."""
+    if task.done():
+        if not task.cancelled():
+            task.exception()
+    else:
+        task.cancel()
+
+
+# ─────────────────────────── Answer cache ─────────────────────────────────────
+
+# (expiry time, result) per request fingerprint, oldest first
+_answer_cache: "OrderedDict[bytes, Tuple[float, Dict]]" = OrderedDict()
+# Answers currently being generated, so identical concurrent requests share one run
+_answer_inflight: Dict[bytes, asyncio.Future] = {}
+
+
+def _answer_cache_key(
+    question: str, top_k: int, park_code: Optional[str], conversation_history: List[Dict]
+) -> bytes:
+    """Fingerprint of everything that determines an answer (question normalized as for embeddings)."""
+    history = tuple((m["role"], m["content"]) for m in conversation_history)
+    normalized = " ".join(question.lower().split())
+    return hashlib.blake2b(repr((normalized, top_k, park_code, history)).encode()).digest()
+
+
+def _answer_cache_get(key: bytes) -> Optional[Dict]:
+    entry = _answer_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, result = entry
+    if expires_at < time.monotonic():
+        del _answer_cache[key]
+        return None
+    _answer_cache.move_to_end(key)
+    return result
+
+
+def _answer_cache_put(key: bytes, result: Dict) -> None:
+    if ANSWER_CACHE_TTL <= 0:
+        return
+    _answer_cache[key] = (time.monotonic() + ANSWER_CACHE_TTL, result)
+    _answer_cache.move_to_end(key)
+    if len(_answer_cache) > ANSWER_CACHE_SIZE:
+        _answer_cache.popitem(last=False)
+
+
+class SemanticCache:
+    """
+    Results keyed by query embedding, looked up by cosine similarity.
+
+    Vectors are stored L2-normalized in one preallocated (capacity, dim)
+    float32 matrix, so a lookup is a single matrix-vector product.  Slots are
+    reused FIFO once the cache is full; entries expire ttl seconds after they
+    are stored.  A threshold or ttl <= 0 disables the cache.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        capacity: int = SEMANTIC_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+    ):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.ttl = ttl
+        self._matrix: Optional[np.ndarray] = None  # allocated on first put (dim unknown)
+        self._entries: List[Optional[Tuple[Tuple, float, Dict]]] = [None] * capacity
+        self._size = 0
+        self._next = 0
+
+    def get(self, vector: np.ndarray, scope: Tuple):
+        """Best unexpired result for scope at or above the threshold, else None."""
+        if not self._size or self.threshold <= 0:
+            return None
+        scores = self._matrix[:self._size] @ (vector / np.linalg.norm(vector))
+        candidates = np.flatnonzero(scores >= self.threshold)
+        now = time.monotonic()
+        for i in candidates[np.argsort(scores[candidates])[::-1]]:
+            entry_scope, expires_at, result = self._entries[i]
+            if entry_scope == scope and expires_at >= now:
+                return result
+        return None
+
+    def put(self, vector: np.ndarray, scope: Tuple, result) -> None:
+        if self.threshold <= 0 or self.ttl <= 0:
+            return
+        if self._matrix is None:
+            self._matrix = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+        self._matrix[self._next] = vector / np.linalg.norm(vector)
+        self._entries[self._next] = (scope, time.monotonic() + self.ttl, result)
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def clear(self) -> None:
+        self._entries = [None] * self.capacity
+        self._size = 0
+        self._next = 0
+
+
+_semantic_cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD)
+# Retrieval results (chunk lists) for near-duplicate searches; see _retrieve_chunks
+_search_cache = SemanticCache(SEARCH_CACHE_THRESHOLD, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
 
 
 # ─────────────────────────── LangGraph state schema ───────────────────────────
@@ -172,6 +1165,7 @@ class RAGState(TypedDict):
     park_code: Optional[str]    # Explicitly provided by the caller
     active_park_code: Optional[str]  # Detected from context, or same as park_code
     search_query: str           # Original or rewritten query sent to the retriever
+    retrieved_query: Optional[str]  # Query context_chunks were already retrieved for
     context_chunks: List[Dict]  # Retrieved documents from Qdrant
     answer: str                 # Final LLM-generated answer
     sources: List[Dict]         # Source metadata for frontend attribution
@@ -190,13 +1184,16 @@ def find_park_in_text(text: str) -> Optional[str]:
     pronouns ("there", "it", "the park") can be resolved without the user
     having to repeat the park name.
 
-    Returns the first matching park code, or None if no park name is found.
+    Returns the code of the first park named in the text, or None if no park
+    name is found.
     """
-    text_lower = text.lower()
-    for park_name, code in PARK_MAPPINGS.items():
-        if park_name in text_lower:
-            return code
-    return None
+    match = _PARK_NAME_RE.search(text)
+    return PARK_MAPPINGS[match.group().lower()] if match else None
+
+
+def _parks_in_text(text: str) -> Set[str]:
+    """Return the codes of every park named in text, in one pass over it."""
+    return {PARK_MAPPINGS[name.lower()] for name in _PARK_NAME_RE.findall(text)}
 
 
 def _detect_park(question: str, conversation_history: List[Dict]) -> Optional[str]:
@@ -212,7 +1209,7 @@ def _detect_park(question: str, conversation_history: List[Dict]) -> Optional[st
     # 1. Current question
     code = find_park_in_text(question)
     if code:
-        logger.info(f"Park detected in current question: {code}")
+        logger.info("Park detected in current question: %s", code)
         return code
 
     # 2. ALL Human Messages in history (most recent first).
@@ -223,7 +1220,7 @@ def _detect_park(question: str, conversation_history: List[Dict]) -> Optional[st
     for msg in reversed(user_messages):
         code = find_park_in_text(msg["content"])
         if code:
-            logger.info(f"Park detected from user history: {code}")
+            logger.info("Park detected from user history: %s", code)
             return code
 
     # 3. Assistant messages — single-park match only.
@@ -232,20 +1229,120 @@ def _detect_park(question: str, conversation_history: List[Dict]) -> Optional[st
     # Later assistant messages may be contaminated by prior mixed-park responses.
     assistant_messages = [m for m in conversation_history if m.get("role") == "assistant"]
     for msg in assistant_messages:
-        lower = msg["content"].lower()
-        matched_codes = {
-            code
-            for park_name, code in PARK_MAPPINGS.items()
-            if park_name in lower
-        }
+        matched_codes = _parks_in_text(msg["content"])
         if len(matched_codes) == 1:
             code = next(iter(matched_codes))
-            logger.info(f"Park detected from assistant message (single match): {code}")
+            logger.info("Park detected from assistant message (single match): %s", code)
             return code
 
     return None
 
 
+@functools.lru_cache(maxsize=64)
+def _park_prompts(park_name: str) -> Tuple[str, str, str]:
+    """
+    Return the (system, pre-context, post-question) strings for a park.
+
+    The templates only vary by park, so each park's strings are formatted once
+    and reused by every later generate_node call.
+    """
+    return (
+        PARK_SYSTEM_PROMPT.format(park_name=park_name),
+        PARK_PRE_CONTEXT.format(park_name=park_name),
+        PARK_POST_QUESTION.format(park_name=park_name),
+    )
+
+
+def _approx_tokens(text: str) -> int:
+    """Approximate token count (rough: 1 token ≈ 4 characters), as in chunk_documents."""
+    return len(text) // 4
+
+
+def _dedup_chunks(context_chunks: List[Dict]) -> List[Dict]:
+    """
+    Drop repeats of an earlier (higher-scoring) chunk, by chunk_id or by text.
+
+    The same passage can be ingested more than once (a page scraped from two
+    sources, re-runs of the upload); each copy would cost its full length in
+    prompt tokens without adding anything.
+    """
+    seen = set()
+    unique = []
+    for chunk in context_chunks:
+        keys = {hashlib.blake2b(" ".join(chunk["text"].split()).encode(), digest_size=16).digest()}
+        if chunk["chunk_id"]:
+            keys.add(chunk["chunk_id"])
+        if keys & seen:
+            continue
+        seen |= keys
+        unique.append(chunk)
+    if len(unique) < len(context_chunks):
+        logger.info("Dropped %d duplicate chunks", len(context_chunks) - len(unique))
+    return unique
+
+
+def _fit_context(context_chunks: List[Dict], budget: int) -> List[Dict]:
+    """
+    Keep the leading (highest-scoring) chunks whose text fits within budget tokens.
+
+    Raises ContextTooLargeError when not even the first chunk fits, so an
+    oversized prompt is rejected before it costs a Groq call.
+    """
+    used = 0
+    for i, chunk in enumerate(context_chunks):
+        used += _approx_tokens(chunk["text"])
+        if used > budget:
+            if i == 0:
+                raise ContextTooLargeError(
+                    "The question and conversation history are too long to fit any "
+                    "retrieved context in the model's context window; shorten them "
+                    "and try again."
+                )
+            logger.info("Context trimmed to %d/%d chunks to fit %d tokens", i, len(context_chunks), budget)
+            return context_chunks[:i]
+    return context_chunks
+
+
+def _trim_history(history: List[Dict]) -> List[Dict]:
+    """Newest messages within HISTORY_MAX_MESSAGES and HISTORY_TOKEN_BUDGET, oldest first."""
+    kept = used = 0
+    for msg in reversed(history):
+        used += _approx_tokens(msg["content"])
+        if kept == HISTORY_MAX_MESSAGES or used > HISTORY_TOKEN_BUDGET:
+            break
+        kept += 1
+    return history[len(history) - kept:]
+
+
+# Chunk fields copied into each source citation, and the keys they're exposed as
+_source_fields = operator.itemgetter("park_name", "park_code", "source_url", "score")
+_SOURCE_KEYS = ("park_name", "park_code", "url", "score")
+
+# Chat-history role → LangChain message class (other roles are dropped)
+_HISTORY_MESSAGE_TYPES = {"user": HumanMessage, "assistant": AIMessage}
+
+
+def _format_context(context_chunks: List[Dict]) -> str:
+    """
+    Render retrieved chunks as the numbered context block for the prompt.
+
+    Writes straight into one buffer rather than building a formatted string
+    per chunk and joining them, so a top_k=10 request doesn't allocate every
+    chunk's text twice.
+    """
+    buf = io.StringIO()
+    for i, chunk in enumerate(context_chunks, 1):
+        if i > 1:
+            buf.write("\n\n")
+        buf.write("[Source ")
+        buf.write(str(i))
+        buf.write(" - ")
+        buf.write(chunk["park_name"])
+        buf.write("]\n")
+        buf.write(chunk["text"])
+    return buf.getvalue()
+
+
 # ─────────────────────────── Graph nodes ──────────────────────────────────────
 
 def extract_park_node(state: RAGState) -> dict:
@@ -270,24 +1367,46 @@ def extract_park_node(state: RAGState) -> dict:
 
     if not active_park_code and state.get("park_code"):
         active_park_code = state["park_code"]
-        logger.info(f"Park from explicit park_code fallback: {active_park_code}")
+        logger.info("Park from explicit park_code fallback: %s", active_park_code)
 
-    logger.info(f"Active park: {active_park_code or 'none (searching all parks)'}")
+    logger.info("Active park: %s", active_park_code or "none (searching all parks)")
     return {"active_park_code": active_park_code}
 
 
-def rewrite_query_node(state: RAGState) -> dict:
+async def rewrite_query_node(state: RAGState) -> dict:
     """
     Node 2 (conditional) — Rewrite the question using LangChain LCEL.
 
     Resolves pronouns and references (e.g. "there", "it") so that the
     retrieval step receives a self-contained query suitable for vector search.
-    Falls back to the original question if the LLM call fails.
+    When a park is active and the only references are to the park itself
+    ("what's the weather there?"), they are substituted with the park name
+    directly and no LLM call is made.  The Groq call goes through the async
+    client so the event loop is never blocked for the round trip.
+
+    Retrieval for the original question starts speculatively alongside the
+    rewrite.  Its chunks are handed to retrieve_node when the rewrite fails,
+    leaves the question materially unchanged, or embeds almost identically to
+    it, and the rewrite keeps the same park scope; otherwise they are
+    discarded.  Falls back to the original question if the LLM call fails.
     """
     question = state["question"]
     history = state.get("conversation_history") or []
     active_park_code = state.get("active_park_code")
 
+    if active_park_code:
+        park_name = CODE_TO_NAME.get(active_park_code, active_park_code.upper())
+        rewritten = _template_rewrite(question, park_name)
+        if rewritten:
+            logger.info("Template rewrite: '%.80s' -> '%.80s'", question, rewritten)
+            return {"search_query": rewritten}
+
+    # Retrieve for the original question while the rewrite is in flight, so
+    # the common fallback cases pay only the slower of the two round trips.
+    speculative = asyncio.ensure_future(
+        _retrieve_chunks(question, state["top_k"], active_park_code)
+    )
+
     conversation_text = "\n".join([
         f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}"
         for m in history[-4:]
@@ -302,28 +1421,55 @@ def rewrite_query_node(state: RAGState) -> dict:
         )
 
     try:
-        llm = ChatGroq(model=MODEL, temperature=0.3, max_tokens=100)
-        chain = REWRITE_PROMPT | llm
-        response = chain.invoke({
+        chain = REWRITE_PROMPT | _get_chat_groq(0.3, max_tokens=100)
+        response = await _ainvoke_llm(chain, {
             "conversation_text": conversation_text,
             "question": question,
             "park_context": park_context,
         })
         rewritten = response.content.strip().strip('"').strip("'").strip()
-        logger.info(f"Query rewrite: '{question}' -> '{rewritten}'")
-        return {"search_query": rewritten}
+        logger.info("Query rewrite: '%.80s' -> '%.80s'", question, rewritten)
 
     except Exception as e:
-        logger.error(f"Query rewriting failed: {e}, using original question")
-        return {"search_query": question}
+        logger.error("Query rewriting failed: %s, using original question", e)
+        rewritten = question
+
+    # retrieve_node scopes an unscoped search to a park the rewrite names;
+    # chunks from the unfiltered speculative search would not match it
+    same_scope = (active_park_code or find_park_in_text(rewritten)) == active_park_code
+    reuse = same_scope and _query_norm(rewritten) == _query_norm(question)
+    if same_scope and not reuse:
+        try:
+            reuse = await _queries_equivalent(question, rewritten)
+        except Exception as e:
+            logger.warning("Rewrite similarity check failed: %s", e)
+    if not reuse:
+        _discard_task(speculative)
+        return {"search_query": rewritten}
+    try:
+        context_chunks = await speculative
+    except Exception as e:
+        # Let retrieve_node retry (and raise) on its own path
+        logger.warning("Speculative retrieval failed: %s", e)
+        return {"search_query": rewritten}
+    # The chunks were retrieved for the original question but stand in for the
+    # (equivalent) rewrite, which stays the query reported downstream
+    return {
+        "search_query": rewritten,
+        "retrieved_query": rewritten,
+        "context_chunks": context_chunks,
+    }
 
 
-def retrieve_node(state: RAGState) -> dict:
+async def retrieve_node(state: RAGState) -> dict:
     """
     Node 3 — Retrieve the top-k most relevant document chunks from Qdrant.
 
-    QdrantVectorStore handles embedding internally, so no separate embed_query
-    node is needed.  Filters by active_park_code when a park has been detected.
+    The search query is embedded with Cohere's async client (_aembed_query) and
+    searched with Qdrant's async client, so the event loop stays free for
+    other requests.  Filters by active_park_code when a park has been
+    detected.  Skips the search when rewrite_query_node already retrieved for
+    this exact search_query.
 
     If extract_park_node found no park in the user's text, this node checks the
     rewritten search_query as a last text-based signal: rewrite_query_node feeds
@@ -347,70 +1493,28 @@ def retrieve_node(state: RAGState) -> dict:
         if code:
             active_park_code = code
             inferred_from_query = True
-            logger.info(f"Park inferred from rewritten query '{search_query}': {code}")
-
-    park_filter = None
-    if active_park_code:
-        park_filter = Filter(
-            must=[
-                FieldCondition(
-                    key="park_code",
-                    match=MatchValue(value=active_park_code),
-                )
-            ]
-        )
-
-    vectorstore = _get_vectorstore()
-    try:
-        docs_with_scores = vectorstore.similarity_search_with_score(
-            query=search_query,
-            k=top_k,
-            filter=park_filter,
-        )
-    except Exception as e:
-        # Qdrant requires a keyword index on park_code for filtered searches.
-        # If the index is missing, fall back to an unfiltered search and filter
-        # the results manually in Python.  Run data_ingestion/create_index.py
-        # to create the index and make this fallback unnecessary.
-        if active_park_code and "Index required" in str(e):
-            logger.warning(
-                "Qdrant park_code index missing — falling back to unfiltered search "
-                "with manual filtering. Run data_ingestion/create_index.py to fix permanently."
-            )
-            docs_all = vectorstore.similarity_search_with_score(
-                query=search_query,
-                k=top_k * 3,
-                filter=None,
-            )
-            docs_with_scores = [
-                (doc, score) for doc, score in docs_all
-                if doc.metadata.get("park_code") == active_park_code
-            ][:top_k]
-        else:
-            raise
+            logger.info("Park inferred from rewritten query '%.80s': %s", search_query, code)
 
-    context_chunks = [
-        {
-            "id": i,
-            "score": score,
-            "text": doc.page_content,
-            "park_code": doc.metadata.get("park_code", ""),
-            "park_name": doc.metadata.get("park_name", ""),
-            "source_url": doc.metadata.get("source_url", ""),
-            "chunk_id": doc.metadata.get("chunk_id", ""),
-        }
-        for i, (doc, score) in enumerate(docs_with_scores)
-    ]
-    logger.info(f"Retrieved {len(context_chunks)} chunks")
+    if state.get("retrieved_query") == search_query:
+        # rewrite_query_node already retrieved for this exact query
+        context_chunks = state["context_chunks"]
+    else:
+        context_chunks = await _retrieve_chunks(search_query, top_k, active_park_code)
+    context_chunks = _dedup_chunks(context_chunks)
+    logger.info("Retrieved %d chunks", len(context_chunks))
 
     if active_park_code and context_chunks:
         parks_found = {c.get("park_code") for c in context_chunks}
         if active_park_code not in parks_found or len(parks_found) > 1:
-            logger.warning(f"Park mismatch: expected {active_park_code}, got {parks_found}")
+            logger.warning("Park mismatch: expected %s, got %s", active_park_code, parks_found)
         else:
-            logger.info(f"All results from expected park: {active_park_code}")
+            logger.info("All results from expected park: %s", active_park_code)
 
     result: dict = {"context_chunks": context_chunks}
+    if not context_chunks:
+        # Nothing to answer from: set the fallback here and end the graph,
+        # rather than routing through a node that only returns a constant.
+        result.update(answer=NO_RESULTS_ANSWER, sources=[], num_sources=0)
     # Propagate inferred park code to generate_node so it can apply the
     # scoped prompt and chunk pre-filter even when extract_park_node found
     # no park name in the user's raw text.
@@ -419,13 +1523,13 @@ def retrieve_node(state: RAGState) -> dict:
     return result
 
 
-def generate_node(state: RAGState) -> dict:
+async def generate_node(state: RAGState) -> dict:
     """
     Node 4 — Generate an answer using LangChain ChatGroq with retrieved context.
 
     Builds a message list of [SystemMessage, *history, HumanMessage] and
-    invokes the Groq LLM.  The user message contains the numbered context
-    sources followed by the question.
+    streams the Groq LLM's answer token by token.  The user message contains
+    the numbered context sources followed by the question.
     """
     question = state["question"]
     context_chunks = state["context_chunks"]
@@ -444,33 +1548,26 @@ def generate_node(state: RAGState) -> dict:
                 code = find_park_in_text(msg.get("content", ""))
                 if code:
                     active_park_code = code
-                    logger.info(f"Park inferred in generate_node from user history: {code}")
+                    logger.info("Park inferred in generate_node from user history: %s", code)
                     break
         # If still None, accept the first assistant message that names a single park
         if not active_park_code:
             for msg in history:
                 if msg.get("role") == "assistant":
-                    lower = msg["content"].lower()
-                    matched = {c for n, c in PARK_MAPPINGS.items() if n in lower}
+                    matched = _parks_in_text(msg["content"])
                     if len(matched) == 1:
                         active_park_code = next(iter(matched))
-                        logger.info(f"Park inferred in generate_node from assistant history: {active_park_code}")
+                        logger.info("Park inferred in generate_node from assistant history: %s", active_park_code)
                         break
 
     # Safety net: if a park is active, strip any chunks from other parks before
-    # the LLM ever sees them.  This covers the rare case where retrieval fallback
+    # the LLM ever sees them.  This covers the rare case where retrieval
     # returned mixed-park results despite the Qdrant filter.
     if active_park_code:
         filtered = [c for c in context_chunks if c.get("park_code") == active_park_code]
         if filtered:
             context_chunks = filtered
 
-    # Format retrieved chunks as numbered sources
-    context_text = "\n\n".join([
-        f"[Source {i+1} - {chunk['park_name']}]\n{chunk['text']}"
-        for i, chunk in enumerate(context_chunks)
-    ])
-
     # Resolve the display name from the code so it's always consistent
     if active_park_code:
         park_name = CODE_TO_NAME.get(active_park_code,
@@ -478,6 +1575,10 @@ def generate_node(state: RAGState) -> dict:
     else:
         park_name = context_chunks[0].get("park_name", "national parks") if context_chunks else "national parks"
 
+    # Only the most recent turns go into the prompt; older ones cost tokens on
+    # every request but rarely matter to the current answer.
+    history = _trim_history(history)
+
     # Sanitize assistant messages that mention other parks.
     # This prevents contaminated prior responses from leaking into the LLM's
     # context even when retrieval is correctly filtered to the active park.
@@ -487,12 +1588,7 @@ def generate_node(state: RAGState) -> dict:
             if msg["role"] == "user":
                 sanitized_history.append(msg)
             else:  # assistant
-                lower = msg["content"].lower()
-                other_parks = {
-                    code
-                    for name, code in PARK_MAPPINGS.items()
-                    if name in lower and code != active_park_code
-                }
+                other_parks = _parks_in_text(msg["content"]) - {active_park_code}
                 if other_parks:
                     sanitized_history.append({
                         "role": "assistant",
@@ -502,27 +1598,24 @@ def generate_node(state: RAGState) -> dict:
                     sanitized_history.append(msg)
         history = sanitized_history
 
-    # Build prompt instructions that sandwich the context.
-    # Placing a clear scope instruction BEFORE the context (so the LLM reads it
-    # first) and AFTER the question (where LLMs weight instructions most heavily)
-    # is more reliable than a single trailing reminder.
+    # Build prompt instructions that sandwich the context, plus a park-scoped
+    # SystemMessage when a park is active.  Fall back to SYSTEM_PROMPT for
+    # general (no active park) queries.
     if active_park_code:
-        pre_context = (
-            f"SCOPE: This conversation is about {park_name}.\n"
-            f"Any pronoun such as 'there', 'it', or 'the park' refers to {park_name}.\n"
-            f"Read only the context below. Ignore any knowledge about other parks.\n\n"
-        )
-        post_question = (
-            f"\n\nRULES:\n"
-            f"1. Answer ONLY about {park_name}.\n"
-            f"2. Use ONLY the context provided above — do not add outside knowledge.\n"
-            f"3. Do NOT mention, compare, or reference any other national park.\n"
-            f"4. If the context does not contain enough information, say so rather "
-            f"than pulling in details from other parks."
-        )
+        system_content, pre_context, post_question = _park_prompts(park_name)
     else:
-        pre_context = ""
-        post_question = "\n\nAnswer using only the context provided above."
+        system_content, pre_context, post_question = SYSTEM_PROMPT, "", GENERAL_POST_QUESTION
+
+    # Drop the lowest-ranked chunks that would push the prompt past
+    # PROMPT_TOKEN_BUDGET; everything else in the prompt is fixed.
+    fixed_tokens = sum(
+        _approx_tokens(text)
+        for text in (system_content, pre_context, post_question, question)
+    ) + sum(_approx_tokens(msg["content"]) for msg in history)
+    context_chunks = _fit_context(context_chunks, PROMPT_TOKEN_BUDGET - fixed_tokens)
+
+    # Format retrieved chunks as numbered sources
+    context_text = _format_context(context_chunks)
 
     user_content = (
         f"{pre_context}"
@@ -531,52 +1624,30 @@ def generate_node(state: RAGState) -> dict:
         f"{post_question}"
     )
 
-    # Use a park-scoped SystemMessage when a park is active to remove the
-    # base prompt's "reference prior turns" language, which can prime the LLM
-    # to draw from contaminated history. Fall back to SYSTEM_PROMPT for
-    # general (no active park) queries.
-    if active_park_code:
-        system_content = (
-            f"You are a helpful National Parks expert assistant. "
-            f"This conversation is specifically about {park_name}.\n\n"
-            f"STRICT RULES — follow these above all else:\n"
-            f"1. Answer ONLY about {park_name}.\n"
-            f"2. Use ONLY the provided context. No outside knowledge.\n"
-            f"3. Do NOT mention, compare, or reference any other national park.\n"
-            f"4. Be friendly and accurate. Prioritize visitor safety when relevant."
-        )
-    else:
-        system_content = SYSTEM_PROMPT
-
     # Assemble messages: system + conversation history + final user prompt
-    messages = [SystemMessage(content=system_content)]
-    for msg in history:
-        if msg["role"] == "user":
-            messages.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "assistant":
-            messages.append(AIMessage(content=msg["content"]))
-    messages.append(HumanMessage(content=user_content))
+    messages = [
+        SystemMessage(content=system_content),
+        *(
+            _HISTORY_MESSAGE_TYPES[msg["role"]](content=msg["content"])
+            for msg in history
+            if msg["role"] in _HISTORY_MESSAGE_TYPES
+        ),
+        HumanMessage(content=user_content),
+    ]
+
+    # Citations are final once the context is fixed; publish them before the
+    # first token so the streaming endpoint can show sources immediately.
+    sources = [dict(zip(_SOURCE_KEYS, _source_fields(chunk))) for chunk in context_chunks]
+    get_stream_writer()({"sources": sources, "num_sources": len(sources)})
 
     try:
-        # streaming=True enables token-level events via astream_events;
-        # invoke() behaviour is unchanged — still returns a complete response.
-        llm = ChatGroq(model=MODEL, temperature=0, streaming=True)
-        response = llm.invoke(messages)
-        answer = response.content
+        # astream() feeds tokens to the graph's "messages" stream; the
+        # non-streaming /api/chat path just gets the joined answer back.
+        answer = await _astream_llm(_get_chat_groq(0, streaming=True), messages)
     except Exception as e:
-        logger.error(f"LLM generation failed: {e}")
+        logger.error("LLM generation failed: %s", e)
         raise
 
-    sources = [
-        {
-            "park_name": chunk["park_name"],
-            "park_code": chunk["park_code"],
-            "url": chunk["source_url"],
-            "score": chunk["score"],
-        }
-        for chunk in context_chunks
-    ]
-
     return {
         "answer": answer,
         "sources": sources,
@@ -584,34 +1655,28 @@ def generate_node(state: RAGState) -> dict:
     }
 
 
-def no_results_node(state: RAGState) -> dict:
-    """
-    Node 5 (alternate) — Return a graceful message when retrieval finds nothing.
-    """
-    return {
-        "answer": (
-            "I couldn't find relevant information to answer your question. "
-            "Please try rephrasing or ask about specific national parks."
-        ),
-        "sources": [],
-        "num_sources": 0,
-    }
-
-
 # ─────────────────────────── Routing functions ────────────────────────────────
 
 def _route_after_park_extraction(state: RAGState) -> str:
-    """Rewrite the query only when there is conversation history to draw from."""
-    if state.get("conversation_history"):
-        return "rewrite_query"
-    return "retrieve"
+    """
+    Rewrite the query only when there is conversation history to draw from and
+    the question may depend on it.  A follow-up that names its park and has no
+    pronoun or back-reference is already self-contained, so it skips the Groq
+    round trip.
+    """
+    if not state.get("conversation_history"):
+        return "retrieve"
+    question = state["question"]
+    if find_park_in_text(question) and not _NEEDS_REWRITE_RE.search(question):
+        return "retrieve"
+    return "rewrite_query"
 
 
 def _route_after_retrieval(state: RAGState) -> str:
     """Generate an answer only when context chunks were actually found."""
     if state.get("context_chunks"):
         return "generate"
-    return "no_results"
+    return END  # retrieve_node already set the fallback answer
 
 
 # ─────────────────────────── Graph construction ───────────────────────────────
@@ -624,18 +1689,20 @@ def _build_graph():
     graph.add_node("rewrite_query", rewrite_query_node)
     graph.add_node("retrieve", retrieve_node)
     graph.add_node("generate", generate_node)
-    graph.add_node("no_results", no_results_node)
 
     graph.add_edge(START, "extract_park")
     graph.add_conditional_edges("extract_park", _route_after_park_extraction)
     graph.add_edge("rewrite_query", "retrieve")
     graph.add_conditional_edges("retrieve", _route_after_retrieval)
     graph.add_edge("generate", END)
-    graph.add_edge("no_results", END)
 
     return graph.compile()
 
 
+# Compiled once; the graph is stateless, so every RAGPipeline shares it.
+_GRAPH = _build_graph()
+
+
 # ─────────────────────────── Public interface ─────────────────────────────────
 
 class RAGPipeline:
@@ -650,7 +1717,28 @@ class RAGPipeline:
     """
 
     def __init__(self):
-        self._graph = _build_graph()
+        self._graph = _GRAPH
+
+    async def warm_up(self) -> None:
+        """Pre-connect to Qdrant, Cohere and Groq (called once from the FastAPI lifespan)."""
+        await _warm_connections()
+
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        Counters for the query-embedding and answer caches since startup.
+
+        embed_hits counts lookups served from the embedding cache and
+        embed_misses the queries sent to Cohere; answer_hits counts requests
+        answered from the answer cache (or by joining an identical in-flight
+        request) and answer_misses the requests that were not; semantic_hits
+        counts those of the latter answered from the semantic cache, and
+        search_hits the retrievals served from the search cache.
+        """
+        return {
+            **_cache_counters,
+            "embed_cache_size": len(_embed_cache),
+            "answer_cache_size": len(_answer_cache),
+        }
 
     async def answer_question(
         self,
@@ -671,11 +1759,73 @@ class RAGPipeline:
 
         Returns:
             Dict with keys: answer, sources, question, num_sources
+
+        Repeated requests are answered from an in-memory TTL cache, and an
+        identical request arriving while one is in flight awaits that run.
         """
         logger.info(
-            f"Question: '{question}' | history: {len(conversation_history or [])} msgs"
+            "Question: '%.80s' | history: %d msgs", question, len(conversation_history or [])
         )
 
+        key = _answer_cache_key(question, top_k, park_code, conversation_history or [])
+        result = _answer_cache_get(key)
+        if result is None:
+            pending = _answer_inflight.get(key)
+            if pending is None:
+                _cache_counters["answer_misses"] += 1
+                pending = asyncio.ensure_future(
+                    self._answer_uncached(question, top_k, park_code, conversation_history)
+                )
+                _answer_inflight[key] = pending
+                pending.add_done_callback(lambda _: _answer_inflight.pop(key, None))
+            else:
+                _cache_counters["answer_hits"] += 1
+            # shield: one caller disconnecting must not cancel the shared run
+            result = await asyncio.shield(pending)
+            _answer_cache_put(key, result)
+        else:
+            _cache_counters["answer_hits"] += 1
+            logger.info("Answer cache hit")
+
+        return {**result, "question": question}
+
+    async def _answer_uncached(
+        self,
+        question: str,
+        top_k: int,
+        park_code: Optional[str],
+        conversation_history: Optional[List[Dict]],
+    ) -> Dict:
+        """
+        Answer from the semantic cache when enabled and applicable, else run the graph.
+
+        Only history-less questions use the semantic cache: a follow-up's
+        answer depends on its conversation.  The question's embedding is the
+        one retrieve_node would compute anyway, so on a miss the lookup costs
+        no extra Cohere call.
+        """
+        if SEMANTIC_CACHE_THRESHOLD <= 0 or conversation_history:
+            return await self._run_graph(question, top_k, park_code, conversation_history)
+
+        vector = await _aembed_query(question)
+        scope = (top_k, park_code)
+        result = _semantic_cache.get(vector, scope)
+        if result is not None:
+            _cache_counters["semantic_hits"] += 1
+            logger.info("Semantic cache hit")
+            return result
+        result = await self._run_graph(question, top_k, park_code, conversation_history)
+        _semantic_cache.put(vector, scope, result)
+        return result
+
+    async def _run_graph(
+        self,
+        question: str,
+        top_k: int,
+        park_code: Optional[str],
+        conversation_history: Optional[List[Dict]],
+    ) -> Dict:
+        """Run the RAG graph once and return the answer fields of the response."""
         initial_state: RAGState = {
             "question": question,
             "top_k": top_k,
@@ -683,6 +1833,7 @@ class RAGPipeline:
             "park_code": park_code,
             "active_park_code": None,
             "search_query": question,
+            "retrieved_query": None,
             "context_chunks": [],
             "answer": "",
             "sources": [],
@@ -694,11 +1845,27 @@ class RAGPipeline:
         return {
             "answer": result["answer"],
             "sources": result["sources"],
-            "question": question,
             "num_sources": result["num_sources"],
             "active_park_code": result.get("active_park_code"),
         }
 
+    async def answer_many(self, requests: List[Dict]) -> List[Dict]:
+        """
+        Answer several questions concurrently, preserving input order.
+
+        Questions without conversation history are searched verbatim, so their
+        embeddings are fetched up front in a single Cohere call and every graph
+        then starts from a warm cache.  Rewritten follow-up queries are not
+        known in advance; those are coalesced by the query batcher instead.
+
+        Args:
+            requests: Dicts of answer_question keyword arguments
+        """
+        await _aembed_queries([
+            r["question"] for r in requests if not r.get("conversation_history")
+        ])
+        return await asyncio.gather(*(self.answer_question(**r) for r in requests))
+
     async def astream_answer(
         self,
         question: str,
@@ -707,17 +1874,22 @@ class RAGPipeline:
         conversation_history: List[Dict] = None,
     ):
         """
-        Stream answer tokens using LangGraph's astream_events.
+        Stream answer tokens using LangGraph's astream.
 
         Runs the full RAG graph and yields dicts as they become available:
+          {"type": "sources", "sources": list,
+                              "num_sources": int}      — before the first token
           {"type": "token",  "content": str}          — one per generated token
           {"type": "done",   "sources": list,
                              "num_sources": int}       — final metadata event
           {"type": "error",  "message": str}           — if an exception occurs
 
-        The generate node uses streaming=True on ChatGroq so that LangGraph's
-        callback system emits on_chat_model_stream events for each token.
-        The no_results path (empty retrieval) emits the fallback text as a
+        Only three stream modes are requested — "messages" (LLM tokens),
+        "custom" (the sources generate_node writes) and "values" (graph
+        state, the last of which is final) — rather than the full
+        astream_events feed of every chain start/end.  The generate node
+        consumes ChatGroq via astream() so each token reaches "messages".
+        The no-results path (empty retrieval) emits the fallback text as a
         single token followed immediately by the done event.
         """
         initial_state: RAGState = {
@@ -727,6 +1899,7 @@ class RAGPipeline:
             "park_code": park_code,
             "active_park_code": None,
             "search_query": question,
+            "retrieved_query": None,
             "context_chunks": [],
             "answer": "",
             "sources": [],
@@ -735,32 +1908,39 @@ class RAGPipeline:
 
         try:
             answer_started = False
+            final_state: Dict = {}
 
-            async for event in self._graph.astream_events(initial_state, version="v2"):
-                event_kind = event.get("event", "")
-                node = event.get("metadata", {}).get("langgraph_node", "")
-
+            async for mode, chunk in self._graph.astream(
+                initial_state, stream_mode=["messages", "custom", "values"]
+            ):
                 # Stream individual tokens from the generate node's LLM call
-                if event_kind == "on_chat_model_stream" and node == "generate":
-                    content = event["data"]["chunk"].content
-                    if content:
+                if mode == "messages":
+                    message, metadata = chunk
+                    if metadata.get("langgraph_node") == "generate" and message.content:
                         answer_started = True
-                        yield {"type": "token", "content": content}
+                        yield {"type": "token", "content": message.content}
+
+                # Citations, written by generate_node before the LLM call
+                elif mode == "custom":
+                    yield {"type": "sources", **chunk}
 
-                # Final graph completion — capture sources and handle no_results path
-                elif event_kind == "on_chain_end" and event.get("name") == "LangGraph":
-                    final_state = event["data"].get("output", {})
-                    sources = final_state.get("sources", [])
-                    num_sources = final_state.get("num_sources", 0)
+                else:
+                    final_state = chunk
 
-                    # no_results path: no LLM call was made, emit the fallback text
-                    if not answer_started and final_state.get("answer"):
-                        yield {"type": "token", "content": final_state["answer"]}
+            # No-results path: no LLM call was made, emit the fallback text
+            if not answer_started and final_state.get("answer"):
+                yield {"type": "token", "content": final_state["answer"]}
 
-                    yield {"type": "done", "sources": sources, "num_sources": num_sources}
+            yield {
+                "type": "done",
+                "sources": final_state.get("sources", []),
+                "num_sources": final_state.get("num_sources", 0),
+            }
 
+        except ContextTooLargeError:
+            raise  # the caller's to fix; the endpoint sends it as a 413 frame
         except Exception as e:
-            logger.error(f"Streaming error: {e}")
+            logger.error("Streaming error: %s", e)
             yield {"type": "error", "message": str(e)}
 
     async def search(
@@ -768,6 +1948,7 @@ class RAGPipeline:
         query: str,
         top_k: int = 10,
         park_code: str = None,
+        hnsw_ef: Optional[int] = None,
     ) -> List[Dict]:
         """
         Direct vector search without LLM generation.
@@ -776,40 +1957,35 @@ class RAGPipeline:
             query: Search query text
             top_k: Number of results to return (default: 10)
             park_code: Optional park code filter
+            hnsw_ef: Optional HNSW candidate-list size (default: chosen from
+                top_k and whether park_code is set)
 
         Returns:
             List of matching document chunks with metadata
         """
-        park_filter = None
-        if park_code:
-            park_filter = Filter(
-                must=[
-                    FieldCondition(
-                        key="park_code",
-                        match=MatchValue(value=park_code),
-                    )
-                ]
-            )
+        return await _retrieve_chunks(query, top_k, park_code, hnsw_ef)
 
-        vectorstore = _get_vectorstore()
-        docs_with_scores = vectorstore.similarity_search_with_score(
-            query=query,
-            k=top_k,
-            filter=park_filter,
-        )
+    async def search_many(
+        self,
+        queries: List[str],
+        top_k: int = 10,
+        park_code: str = None,
+        hnsw_ef: Optional[int] = None,
+    ) -> List[List[Dict]]:
+        """
+        Run several direct vector searches at once, preserving input order.
 
-        return [
-            {
-                "id": i,
-                "score": score,
-                "text": doc.page_content,
-                "park_code": doc.metadata.get("park_code", ""),
-                "park_name": doc.metadata.get("park_name", ""),
-                "source_url": doc.metadata.get("source_url", ""),
-                "chunk_id": doc.metadata.get("chunk_id", ""),
-            }
-            for i, (doc, score) in enumerate(docs_with_scores)
-        ]
+        All queries are embedded in a single Cohere call up front, and the
+        concurrent searches are coalesced by the search batcher into one
+        Qdrant query_batch_points request.
+
+        Returns:
+            One list of matching chunks per query, as returned by search()
+        """
+        await _aembed_queries(queries)
+        return await asyncio.gather(
+            *(self.search(q, top_k, park_code, hnsw_ef) for q in queries)
+        )
 
 
 # Global instance
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The backend runs as flat modules (`python main.py` from backend/)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,143 @@
+import asyncio
+
+import orjson
+from fastapi.testclient import TestClient
+
+import main
+import pipeline
+
+
+def _call(middleware, path, content_length):
+    """Run one http request through an ASGI middleware; return (status, body, app_called)."""
+    called = []
+
+    async def app(scope, receive, send):
+        called.append(True)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "headers": [(b"content-length", content_length)],
+    }
+    asyncio.run(middleware(app)(scope, receive, send))
+    body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    return messages[0]["status"], body, bool(called)
+
+
+def test_body_limit_passes_small_body():
+    assert _call(main.BodySizeLimitMiddleware, "/api/chat", b"100") == (200, b"{}", True)
+
+
+def test_body_limit_rejects_oversized_body():
+    status, body, called = _call(
+        main.BodySizeLimitMiddleware, "/api/chat", str(main.MAX_BODY_BYTES + 1).encode()
+    )
+    assert (status, called) == (413, False)
+    assert orjson.loads(body)["detail"] == "Payload too large"
+
+
+def test_body_limit_uses_per_path_limit():
+    length = str(2 * main.MAX_BODY_BYTES).encode()
+    assert _call(main.BodySizeLimitMiddleware, "/api/chat/batch", length)[0] == 200
+    assert _call(main.BodySizeLimitMiddleware, "/api/chat", length)[0] == 413
+
+
+def test_body_limit_rejects_malformed_content_length():
+    for value in (b"abc", b"", b"-5", b"1.5"):
+        status, body, called = _call(main.BodySizeLimitMiddleware, "/api/chat", value)
+        assert (status, called) == (400, False), value
+        assert orjson.loads(body)["detail"] == "Invalid Content-Length"
+
+
+# ─────────────────────────── Oversized prompts ────────────────────────────────
+
+def _too_large(*args, **kwargs):
+    raise pipeline.ContextTooLargeError("too long")
+
+
+def test_chat_maps_context_too_large_to_413(monkeypatch):
+    monkeypatch.setattr(pipeline.rag_pipeline, "answer_question", _too_large)
+    client = TestClient(main.app, raise_server_exceptions=False)
+    response = client.post("/api/chat", json={"question": "Tell me about Zion"})
+    assert response.status_code == 413
+    assert response.json() == {"detail": "too long"}
+
+
+def _prompt_too_large(monkeypatch):
+    """Run the real pipeline up to generate_node, whose _fit_context then rejects the prompt."""
+    async def fake_retrieve(search_query, top_k, active_park_code, hnsw_ef=None):
+        return [{"text": "Hot summers", "park_code": "zion", "park_name": "Zion National Park",
+                 "chunk_id": "zion_chunk_0", "source_url": "", "score": 0.9}]
+
+    def fit_nothing(context_chunks, budget):
+        raise pipeline.ContextTooLargeError("too long")
+
+    monkeypatch.setattr(pipeline, "_retrieve_chunks", fake_retrieve)
+    monkeypatch.setattr(pipeline, "_fit_context", fit_nothing)
+
+
+def test_chat_stream_sends_413_error_frame(monkeypatch):
+    _prompt_too_large(monkeypatch)
+    client = TestClient(main.app, raise_server_exceptions=False)
+    response = client.post("/api/chat/stream", json={"question": "Tell me about Zion"})
+    frames = [line[len("data: "):] for line in response.text.split("\n\n") if line]
+    assert orjson.loads(frames[0]) == {"type": "error", "status": 413, "message": "too long"}
+    assert frames[-1] == "[DONE]"
+
+
+def test_chat_413_keeps_cors_headers(monkeypatch):
+    monkeypatch.setattr(pipeline.rag_pipeline, "answer_question", _too_large)
+    client = TestClient(main.app, raise_server_exceptions=False)
+    response = client.post(
+        "/api/chat",
+        json={"question": "Tell me about Zion"},
+        headers={"Origin": "https://app.example"},
+    )
+    assert response.status_code == 413
+    assert "access-control-allow-origin" in response.headers
+
+
+# ─────────────────────────── ETag revalidation ────────────────────────────────
+
+def test_parks_revalidation_returns_304():
+    client = TestClient(main.app)
+    first = client.get("/api/parks")
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == "public, max-age=300"
+
+    etag = first.headers["etag"]
+    second = client.get("/api/parks", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+
+
+def test_search_etag_changes_with_results(monkeypatch):
+    results = [[{"text": "Hot summers", "park_code": "zion", "score": 0.9}]]
+
+    async def fake_search(**kwargs):
+        return results[0]
+
+    monkeypatch.setattr(pipeline.rag_pipeline, "search", fake_search)
+    client = TestClient(main.app)
+    etag = client.post("/api/search", json={"query": "weather"}).headers["etag"]
+
+    cached = client.post("/api/search", json={"query": "weather"}, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+    results[0] = []
+    changed = client.post("/api/search", json={"query": "weather"}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json() == []
+    assert changed.headers["etag"] != etag
@@ -0,0 +1,557 @@
+import asyncio
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import pytest
+from cohere.errors import TooManyRequestsError
+from groq import RateLimitError
+
+import pipeline
+
+
+def _chunk(text, chunk_id="c"):
+    return {"text": text, "chunk_id": chunk_id}
+
+
+# ─────────────────────────── _fit_context ─────────────────────────────────────
+
+def test_fit_context_keeps_chunks_within_budget():
+    chunks = [_chunk("a" * 400, "1"), _chunk("b" * 400, "2"), _chunk("c" * 400, "3")]
+    assert pipeline._fit_context(chunks, 250) == chunks[:2]
+
+
+def test_fit_context_keeps_everything_that_fits():
+    chunks = [_chunk("a" * 40), _chunk("b" * 40)]
+    assert pipeline._fit_context(chunks, 1000) == chunks
+
+
+def test_fit_context_rejects_prompt_with_no_room_for_context():
+    with pytest.raises(pipeline.ContextTooLargeError):
+        pipeline._fit_context([_chunk("a" * 400)], 50)
+
+
+# ─────────────────────────── _template_rewrite ────────────────────────────────
+
+ZION = "Zion National Park"
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What's the weather there?", f"What's the weather in {ZION}?"),
+    ("Is the park crowded in July?", f"Is {ZION} crowded in July?"),
+    ("What wildlife lives there?", f"What wildlife lives in {ZION}?"),
+])
+def test_template_rewrite_substitutes_single_park_reference(question, expected):
+    assert pipeline._template_rewrite(question, ZION) == expected
+
+
+@pytest.mark.parametrize("question", [
+    # "there" as a destination / origin
+    "How do I get there from Vegas?",
+    "How long does it take to drive there?",
+    "Can I fly there?",
+    "How far is Bryce from there?",
+    # more than one reference
+    "Is the park open there in winter?",
+    # already names a park
+    "What's the weather there in Zion?",
+    "Is the park bigger than Yosemite?",
+    # existential "there", no park reference
+    "Is there camping?",
+    "Are there bears?",
+    # another pronoun that may not mean the park
+    "Is it open there?",
+    # too long for a template
+    "What " + "very " * 20 + "good hikes are there?",
+])
+def test_template_rewrite_leaves_question_to_llm(question):
+    assert pipeline._template_rewrite(question, ZION) is None
+
+
+def test_park_ref_re_skips_existential_there():
+    assert not pipeline._PARK_REF_RE.search("Is there a shuttle?")
+    assert not pipeline._PARK_REF_RE.search("There are many trails")
+    assert not pipeline._PARK_REF_RE.search("there's a fee")
+    assert pipeline._PARK_REF_RE.search("Are dogs allowed there?")
+
+
+# ─────────────────────────── SemanticCache ────────────────────────────────────
+
+def _vec(*values):
+    return np.asarray(values, dtype=np.float32)
+
+
+def test_semantic_cache_hits_near_duplicate_in_same_scope():
+    cache = pipeline.SemanticCache(0.95, capacity=4, ttl=60)
+    cache.put(_vec(1, 0, 0), ("zion", 5), "result")
+
+    assert cache.get(_vec(1, 0.1, 0), ("zion", 5)) == "result"
+    assert cache.get(_vec(1, 0.1, 0), ("yell", 5)) is None
+    assert cache.get(_vec(0, 1, 0), ("zion", 5)) is None
+
+
+def test_semantic_cache_disabled_by_zero_threshold():
+    cache = pipeline.SemanticCache(0, capacity=4, ttl=60)
+    cache.put(_vec(1, 0, 0), ("zion", 5), "result")
+    assert cache.get(_vec(1, 0, 0), ("zion", 5)) is None
+
+
+def test_semantic_cache_expires_entries(monkeypatch):
+    cache = pipeline.SemanticCache(0.95, capacity=4, ttl=60)
+    now = [1000.0]
+    monkeypatch.setattr(pipeline.time, "monotonic", lambda: now[0])
+    cache.put(_vec(1, 0, 0), ("zion", 5), "result")
+
+    now[0] += 61
+    assert cache.get(_vec(1, 0, 0), ("zion", 5)) is None
+
+
+def test_semantic_cache_reuses_oldest_slot_when_full():
+    cache = pipeline.SemanticCache(0.95, capacity=2, ttl=60)
+    cache.put(_vec(1, 0, 0), ("zion",), "x")
+    cache.put(_vec(0, 1, 0), ("zion",), "y")
+    cache.put(_vec(0, 0, 1), ("zion",), "z")
+
+    assert cache.get(_vec(1, 0, 0), ("zion",)) is None
+    assert cache.get(_vec(0, 1, 0), ("zion",)) == "y"
+    assert cache.get(_vec(0, 0, 1), ("zion",)) == "z"
+
+
+def test_semantic_cache_clear():
+    cache = pipeline.SemanticCache(0.95, capacity=4, ttl=60)
+    cache.put(_vec(1, 0, 0), ("zion",), "result")
+    cache.clear()
+    assert cache.get(_vec(1, 0, 0), ("zion",)) is None
+
+
+# ─────────────────────────── search cache ─────────────────────────────────────
+
+def _search_stub(monkeypatch, threshold):
+    """Route _retrieve_chunks to fake embeddings and a counting fake search."""
+    vectors = {"weather in zion": _vec(1, 0, 0), "zion weather": _vec(1, 0.05, 0)}
+    searches = []
+
+    async def fake_embed(query):
+        return vectors[query]
+
+    async def fake_search(query_vector, limit, park_filter, hnsw_ef):
+        searches.append(limit)
+        payload = {"text": "Hot summers", "park_code": "zion", "chunk_id": "zion_chunk_0"}
+        return [SimpleNamespace(score=0.9, payload=payload)]
+
+    monkeypatch.setattr(pipeline, "RERANK_MODEL", "")
+    monkeypatch.setattr(pipeline, "_aembed_query", fake_embed)
+    monkeypatch.setattr(pipeline, "_asearch_by_vector", fake_search)
+    monkeypatch.setattr(pipeline, "_search_cache", pipeline.SemanticCache(threshold, 8, 60))
+    return searches
+
+
+def test_search_cache_reuses_near_duplicate_search(monkeypatch):
+    searches = _search_stub(monkeypatch, 0.95)
+
+    first = asyncio.run(pipeline._retrieve_chunks("weather in zion", 5, "zion"))
+    second = asyncio.run(pipeline._retrieve_chunks("zion weather", 5, "zion"))
+
+    assert second == first
+    assert len(searches) == 1
+
+
+def test_search_cache_keeps_park_scopes_apart(monkeypatch):
+    searches = _search_stub(monkeypatch, 0.95)
+
+    asyncio.run(pipeline._retrieve_chunks("weather in zion", 5, "zion"))
+    asyncio.run(pipeline._retrieve_chunks("zion weather", 5, None))
+
+    assert len(searches) == 2
+
+
+def test_search_cache_disabled_searches_every_time(monkeypatch):
+    searches = _search_stub(monkeypatch, 0)
+
+    asyncio.run(pipeline._retrieve_chunks("weather in zion", 5, "zion"))
+    asyncio.run(pipeline._retrieve_chunks("weather in zion", 5, "zion"))
+
+    assert len(searches) == 2
+
+
+# ─────────────────────────── _MicroBatcher ────────────────────────────────────
+
+def test_micro_batcher_requires_process():
+    with pytest.raises(TypeError):
+        pipeline._MicroBatcher(1, 8)
+
+
+def test_micro_batcher_coalesces_concurrent_submits():
+    class Doubler(pipeline._MicroBatcher):
+        def __init__(self):
+            super().__init__(flush_after_ms=5, max_batch=8)
+            self.batches = []
+
+        async def _process(self, items):
+            self.batches.append(items)
+            return [item * 2 for item in items]
+
+    async def run():
+        batcher = Doubler()
+        results = await asyncio.gather(*(batcher._submit(i) for i in range(3)))
+        return batcher, results
+
+    batcher, results = asyncio.run(run())
+    assert results == [0, 2, 4]
+    assert batcher.batches == [[0, 1, 2]]
+
+
+# ─────────────────────────── _trim_history ────────────────────────────────────
+
+def _msg(content, role="user"):
+    return {"role": role, "content": content}
+
+
+def test_trim_history_keeps_newest_messages(monkeypatch):
+    monkeypatch.setattr(pipeline, "HISTORY_MAX_MESSAGES", 2)
+    history = [_msg("one"), _msg("two"), _msg("three")]
+    assert pipeline._trim_history(history) == history[1:]
+
+
+def test_trim_history_stops_at_token_budget(monkeypatch):
+    monkeypatch.setattr(pipeline, "HISTORY_MAX_MESSAGES", 8)
+    monkeypatch.setattr(pipeline, "HISTORY_TOKEN_BUDGET", 150)
+    history = [_msg("a" * 400), _msg("b" * 400), _msg("c" * 40)]
+    assert pipeline._trim_history(history) == history[1:]
+
+
+def test_trim_history_drops_message_over_budget(monkeypatch):
+    monkeypatch.setattr(pipeline, "HISTORY_TOKEN_BUDGET", 10)
+    assert pipeline._trim_history([_msg("a" * 400)]) == []
+
+
+# ─────────────────────────── _dedup_chunks ────────────────────────────────────
+
+def test_dedup_chunks_drops_repeated_chunk_id():
+    chunks = [_chunk("first copy", "zion_chunk_1"), _chunk("second copy", "zion_chunk_1")]
+    assert pipeline._dedup_chunks(chunks) == chunks[:1]
+
+
+def test_dedup_chunks_drops_same_text_ignoring_whitespace():
+    chunks = [_chunk("Angels Landing  is\nsteep", "a"), _chunk("Angels Landing is steep", "b")]
+    assert pipeline._dedup_chunks(chunks) == chunks[:1]
+
+
+def test_dedup_chunks_keeps_distinct_chunks_in_order():
+    chunks = [_chunk("one", "a"), _chunk("two", ""), _chunk("three", "")]
+    assert pipeline._dedup_chunks(chunks) == chunks
+
+
+# ─────────────────────────── quantize_int8 ────────────────────────────────────
+
+def test_quantize_int8_round_trips_within_half_a_step():
+    vector = np.random.default_rng(0).standard_normal(1024).astype(np.float32)
+    codes, scale = pipeline.quantize_int8(vector)
+
+    assert codes.dtype == np.int8
+    assert np.abs(codes).max() == 127
+    restored = pipeline.dequantize_int8(codes, scale)
+    assert np.abs(restored - vector).max() <= scale / 2 + 1e-6
+
+
+def test_quantize_int8_zero_vector():
+    codes, scale = pipeline.quantize_int8(np.zeros(4, dtype=np.float32))
+    assert not codes.any()
+    assert not pipeline.dequantize_int8(codes, scale).any()
+
+
+# ─────────────────────────── astream_answer ───────────────────────────────────
+
+def test_astream_answer_raises_context_too_large(monkeypatch):
+    async def fake_retrieve(search_query, top_k, active_park_code, hnsw_ef=None):
+        return [{"text": "Hot summers", "park_code": "zion", "park_name": "Zion National Park",
+                 "chunk_id": "zion_chunk_0", "source_url": "", "score": 0.9}]
+
+    def fit_nothing(context_chunks, budget):
+        raise pipeline.ContextTooLargeError("too long")
+
+    monkeypatch.setattr(pipeline, "_retrieve_chunks", fake_retrieve)
+    monkeypatch.setattr(pipeline, "_fit_context", fit_nothing)
+
+    async def run():
+        return [event async for event in pipeline.rag_pipeline.astream_answer("Tell me about Zion")]
+
+    with pytest.raises(pipeline.ContextTooLargeError):
+        asyncio.run(run())
+
+
+# ─────────────────────────── speculative retrieval ────────────────────────────
+
+def _rewrite_stub(monkeypatch, rewritten, equivalent=True):
+    """Fake the rewrite LLM, the similarity check and retrieval; return the searches made."""
+    searches = []
+
+    async def fake_retrieve(search_query, top_k, active_park_code, hnsw_ef=None):
+        searches.append((search_query, active_park_code))
+        return [_chunk("Speculative chunk", "spec_0")]
+
+    async def fake_invoke(chain, inputs):
+        return SimpleNamespace(content=rewritten)
+
+    async def fake_equivalent(question, rewrite):
+        return equivalent
+
+    monkeypatch.setattr(pipeline, "_retrieve_chunks", fake_retrieve)
+    monkeypatch.setattr(pipeline, "_get_chat_groq", lambda *args, **kwargs: (lambda x: x))
+    monkeypatch.setattr(pipeline, "_ainvoke_llm", fake_invoke)
+    monkeypatch.setattr(pipeline, "_queries_equivalent", fake_equivalent)
+    return searches
+
+
+def _rewrite_state(question, active_park_code=None):
+    return {
+        "question": question,
+        "top_k": 5,
+        "active_park_code": active_park_code,
+        "conversation_history": [{"role": "user", "content": "Tell me about hiking"}],
+    }
+
+
+def test_rewrite_reuses_equivalent_speculative_retrieval(monkeypatch):
+    searches = _rewrite_stub(monkeypatch, "Which trails are good for hiking?")
+
+    result = asyncio.run(pipeline.rewrite_query_node(_rewrite_state("Which trails are good?")))
+
+    assert searches == [("Which trails are good?", None)]
+    assert result["retrieved_query"] == result["search_query"] == "Which trails are good for hiking?"
+    assert result["context_chunks"] == [_chunk("Speculative chunk", "spec_0")]
+
+
+def test_rewrite_discards_speculative_retrieval_when_not_equivalent(monkeypatch):
+    _rewrite_stub(monkeypatch, "What are the best winter campsites?", equivalent=False)
+
+    result = asyncio.run(pipeline.rewrite_query_node(_rewrite_state("Which trails are good?")))
+
+    assert result == {"search_query": "What are the best winter campsites?"}
+
+
+def test_rewrite_discards_unscoped_speculative_retrieval_when_rewrite_names_park(monkeypatch):
+    _rewrite_stub(monkeypatch, "Which trails in Zion are good?")
+
+    result = asyncio.run(pipeline.rewrite_query_node(_rewrite_state("Which trails are good?")))
+
+    # retrieve_node will scope this search to zion; unfiltered chunks can't stand in
+    assert result == {"search_query": "Which trails in Zion are good?"}
+
+
+def test_rewrite_reuses_scoped_speculative_retrieval_when_rewrite_names_same_park(monkeypatch):
+    searches = _rewrite_stub(monkeypatch, "Which trails in Zion are good?")
+
+    result = asyncio.run(pipeline.rewrite_query_node(_rewrite_state("Which trails are good?", "zion")))
+
+    assert searches == [("Which trails are good?", "zion")]
+    assert result["retrieved_query"] == "Which trails in Zion are good?"
+
+
+def test_search_cache_hits_do_not_share_chunks(monkeypatch):
+    _search_stub(monkeypatch, 0.95)
+
+    first = asyncio.run(pipeline._retrieve_chunks("weather in zion", 5, "zion"))
+    first[0]["text"] = "mutated by the first request"
+    second = asyncio.run(pipeline._retrieve_chunks("zion weather", 5, "zion"))
+    second[0]["score"] = 0.0
+    third = asyncio.run(pipeline._retrieve_chunks("zion weather", 5, "zion"))
+
+    assert third[0]["text"] == "Hot summers"
+    assert third[0]["score"] == 0.9
+
+
+def test_new_payload_index_clears_result_caches(monkeypatch):
+    class FakeQdrant:
+        async def get_collection(self, name):
+            return SimpleNamespace(payload_schema={})
+
+        async def create_payload_index(self, **kwargs):
+            pass
+
+    vector = _vec(1, 0, 0)
+    search_cache = pipeline.SemanticCache(0.95, 4, 60)
+    semantic_cache = pipeline.SemanticCache(0.95, 4, 60)
+    search_cache.put(vector, ("zion",), ())
+    semantic_cache.put(vector, ("zion",), {"answer": "stale"})
+    monkeypatch.setattr(pipeline, "_get_qdrant_client", lambda: FakeQdrant())
+    monkeypatch.setattr(pipeline, "_search_cache", search_cache)
+    monkeypatch.setattr(pipeline, "_semantic_cache", semantic_cache)
+    monkeypatch.setitem(pipeline._answer_cache, b"key", (float("inf"), {"answer": "stale"}))
+
+    asyncio.run(pipeline.ensure_payload_index())
+
+    assert search_cache.get(vector, ("zion",)) is None
+    assert semantic_cache.get(vector, ("zion",)) is None
+    assert not pipeline._answer_cache
+
+
+# ─────────────────────────── retry_on_rate_limit ──────────────────────────────
+
+def _flaky(failures):
+    """Async callable that raises each of failures in turn, then returns "ok"."""
+    calls = []
+
+    async def call():
+        calls.append(True)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return "ok"
+
+    return call, calls
+
+
+def _record_sleeps(monkeypatch):
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(pipeline.asyncio, "sleep", fake_sleep)
+    return delays
+
+
+def _groq_429(message):
+    request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+    return RateLimitError(message, response=httpx.Response(429, request=request), body=None)
+
+
+def test_retry_on_rate_limit_honors_retry_after_header(monkeypatch):
+    delays = _record_sleeps(monkeypatch)
+    call, calls = _flaky([TooManyRequestsError(body=None, headers={"retry-after": "2"})])
+
+    assert asyncio.run(pipeline.retry_on_rate_limit()(call)()) == "ok"
+    assert len(calls) == 2
+    assert delays == [2.0]
+
+
+def test_retry_on_rate_limit_parses_try_again_in_message(monkeypatch):
+    delays = _record_sleeps(monkeypatch)
+    call, _ = _flaky([_groq_429("Rate limit reached. Please try again in 1m2.5s.")])
+
+    assert asyncio.run(pipeline.retry_on_rate_limit(cap=120)(call)()) == "ok"
+    assert delays == [62.5]
+
+
+def test_retry_on_rate_limit_caps_delay(monkeypatch):
+    delays = _record_sleeps(monkeypatch)
+    call, _ = _flaky([TooManyRequestsError(body=None, headers={"retry-after": "600"})])
+
+    asyncio.run(pipeline.retry_on_rate_limit(cap=30)(call)())
+    assert delays == [30]
+
+
+def test_retry_on_rate_limit_gives_up_after_max_attempts(monkeypatch):
+    delays = _record_sleeps(monkeypatch)
+    errors = [TooManyRequestsError(body=None, headers={"retry-after": "1"}) for _ in range(4)]
+    call, calls = _flaky(errors)
+
+    with pytest.raises(TooManyRequestsError):
+        asyncio.run(pipeline.retry_on_rate_limit(max_attempts=4)(call)())
+    assert len(calls) == 4
+    assert len(delays) == 3
+
+
+def test_retry_on_rate_limit_does_not_retry_other_errors(monkeypatch):
+    delays = _record_sleeps(monkeypatch)
+    call, calls = _flaky([ValueError("bad request")])
+
+    with pytest.raises(ValueError):
+        asyncio.run(pipeline.retry_on_rate_limit()(call)())
+    assert len(calls) == 1
+    assert delays == []
+
+
+def test_retry_on_rate_limit_wraps_sync_functions(monkeypatch):
+    delays = []
+    monkeypatch.setattr(pipeline.time, "sleep", delays.append)
+    calls = []
+
+    def call():
+        calls.append(True)
+        if len(calls) == 1:
+            raise TooManyRequestsError(body=None, headers={"Retry-After": "3"})
+        return "ok"
+
+    assert pipeline.retry_on_rate_limit()(call)() == "ok"
+    assert delays == [3.0]
+
+
+# ─────────────────────────── answer cache ─────────────────────────────────────
+
+def _graph_stub(monkeypatch, fail_first=False):
+    """Replace the graph run with a counting fake; fresh answer caches per test."""
+    runs = []
+
+    async def fake_run_graph(question, top_k, park_code, conversation_history):
+        runs.append(question)
+        await asyncio.sleep(0.01)
+        if fail_first and len(runs) == 1:
+            raise RuntimeError("Groq unavailable")
+        return {"answer": f"Answer {len(runs)}", "sources": [], "num_sources": 0}
+
+    monkeypatch.setattr(pipeline, "SEMANTIC_CACHE_THRESHOLD", 0)
+    monkeypatch.setattr(pipeline, "_answer_cache", OrderedDict())
+    monkeypatch.setattr(pipeline, "_answer_inflight", {})
+    monkeypatch.setattr(pipeline.rag_pipeline, "_run_graph", fake_run_graph)
+    return runs
+
+
+def test_answer_cache_serves_repeated_question(monkeypatch):
+    runs = _graph_stub(monkeypatch)
+    answer = pipeline.rag_pipeline.answer_question
+
+    first = asyncio.run(answer("Best hikes in Zion?"))
+    second = asyncio.run(answer("best  hikes in zion?"))
+
+    assert len(runs) == 1
+    assert second["answer"] == first["answer"] == "Answer 1"
+    assert second["question"] == "best  hikes in zion?"
+
+
+def test_answer_cache_shares_one_run_between_concurrent_requests(monkeypatch):
+    runs = _graph_stub(monkeypatch)
+
+    async def run():
+        return await asyncio.gather(
+            *(pipeline.rag_pipeline.answer_question("Best hikes in Zion?") for _ in range(3))
+        )
+
+    results = asyncio.run(run())
+
+    assert len(runs) == 1
+    assert [r["answer"] for r in results] == ["Answer 1"] * 3
+    assert not pipeline._answer_inflight
+
+
+def test_answer_cache_does_not_store_failures(monkeypatch):
+    runs = _graph_stub(monkeypatch, fail_first=True)
+    answer = pipeline.rag_pipeline.answer_question
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(answer("Best hikes in Zion?"))
+    result = asyncio.run(answer("Best hikes in Zion?"))
+
+    assert len(runs) == 2
+    assert result["answer"] == "Answer 2"
+
+
+def test_answer_cache_keys_on_history(monkeypatch):
+    runs = _graph_stub(monkeypatch)
+    answer = pipeline.rag_pipeline.answer_question
+    history = [{"role": "user", "content": "Tell me about Zion"}]
+
+    asyncio.run(answer("What about camping?"))
+    asyncio.run(answer("What about camping?", conversation_history=history))
+
+    assert len(runs) == 2
+
+
+# ─────────────────────────── _per_minute_rate_limiter ─────────────────────────
+
+def test_per_minute_rate_limiter_starts_full():
+    limiter = pipeline._per_minute_rate_limiter(30)
+
+    assert all(limiter.acquire(blocking=False) for _ in range(30))
+    assert not limiter.acquire(blocking=False)
@@ -1,11 +1,21 @@
 """
 Chunk scraped documents into smaller pieces for embedding
 """
+import bisect
+import functools
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Tuple
+import orjson
 from tqdm import tqdm
 
+try:
+    from tokenizers import Tokenizer  # optional: exact token-based chunking
+except ImportError:
+    Tokenizer = None
+
 # Configuration
 INPUT_DIR = Path("../data/raw")
 OUTPUT_DIR = Path("../data/processed")
@@ -13,17 +23,73 @@ OUTPUT_DIR = Path("../data/processed")
 CHUNK_SIZE = 800  # tokens (approximate by characters)
 CHUNK_OVERLAP = 200  # overlap between chunks
 
+# Hugging Face tokenizer to measure chunks in real tokens, e.g.
+# "Cohere/Cohere-embed-english-v3.0" (needs the tokenizers package).
+# Unset, chunk sizes are approximated as 4 characters per token.
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "").strip()
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer():
+    """The CHUNK_TOKENIZER tokenizer (loaded once per process), or None to chunk by characters"""
+    if not CHUNK_TOKENIZER or Tokenizer is None:
+        return None
+    return Tokenizer.from_pretrained(CHUNK_TOKENIZER)
+
+
+def find_break(text: str, window_start: int, end: int) -> int:
+    """End of the last paragraph or sentence break in text[window_start:end], else end"""
+    for delimiter in ['\n\n', '\n', '. ', '! ', '? ']:
+        last_delim = text.rfind(delimiter, window_start, end)
+        if last_delim != -1:
+            return last_delim + len(delimiter)
+    return end
+
 
-def count_tokens_approx(text: str) -> int:
-    """Approximate token count (rough: 1 token ≈ 4 characters)"""
-    return len(text) // 4
+def chunk_text_by_tokens(text: str, tokenizer, chunk_size: int, overlap: int) -> List[Tuple[str, int]]:
+    """
+    Split text into chunks of at most chunk_size real tokens, overlapping by overlap tokens.
 
+    The text is tokenized once; chunks are sliced by the tokens' character
+    offsets and, like chunk_text, end at a sentence or paragraph break in
+    their last ~50 tokens when there is one. Returns (chunk, token count) pairs.
+    """
+    offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+    token_starts = [start for start, _ in offsets]
+    token_total = len(offsets)
+
+    chunks = []
+    start_tok = 0
+    while start_tok < token_total:
+        end_tok = min(start_tok + chunk_size, token_total)
+        start = offsets[start_tok][0]
+        end = offsets[end_tok - 1][1]
+
+        if end_tok < token_total:
+            window_start = offsets[max(end_tok - 50, start_tok)][0]
+            end = find_break(text, window_start, end)
+            end_tok = bisect.bisect_left(token_starts, end)
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append((chunk, end_tok - start_tok))
 
-def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
-    """Split text into overlapping chunks"""
+        if end_tok >= token_total:
+            break
+        start_tok = max(end_tok - overlap, start_tok + 1)
+
+    return chunks
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Tuple[str, int]]:
+    """Split text into overlapping chunks, as (chunk, token count) pairs"""
     if not text:
         return []
 
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        return chunk_text_by_tokens(text, tokenizer, chunk_size, overlap)
+
     # Convert chunk size from tokens to characters (rough approximation)
     chunk_chars = chunk_size * 4
     overlap_chars = overlap * 4
@@ -37,16 +103,11 @@ def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVE
 
         # Find a good breaking point (end of sentence or paragraph)
         if end < text_length:
-            # Look for sentence endings
-            for delimiter in ['\n\n', '\n', '. ', '! ', '? ']:
-                last_delim = text.rfind(delimiter, start + chunk_chars - 200, end)
-                if last_delim != -1:
-                    end = last_delim + len(delimiter)
-                    break
+            end = find_break(text, start + chunk_chars - 200, end)
 
         chunk = text[start:end].strip()
         if chunk:
-            chunks.append(chunk)
+            chunks.append((chunk, len(chunk) // 4))  # rough: 1 token ≈ 4 characters
 
         start = end - overlap_chars
 
@@ -122,27 +183,131 @@ def create_chunks_from_park_data(park_file: Path) -> List[Dict]:
     text_chunks = chunk_text(full_text)
 
     # Create chunk objects with metadata
-    chunks = []
-    for idx, chunk in enumerate(text_chunks):
-        chunk_obj = {
+    source_url = f"https://www.nps.gov/{park_code}/index.htm"
+    return [
+        {
             "id": f"{park_code}_chunk_{idx}",
             "park_code": park_code,
             "park_name": park_name,
             "chunk_index": idx,
             "text": chunk,
-            "token_count": count_tokens_approx(chunk),
-            "source_url": f"https://www.nps.gov/{park_code}/index.htm",
+            "token_count": token_count,
+            "source_url": source_url,
             "metadata": {
                 "park_code": park_code,
                 "park_name": park_name,
                 "chunk_index": idx,
             }
         }
-        chunks.append(chunk_obj)
+        for idx, (chunk, token_count) in enumerate(text_chunks)
+    ]
+
+
+def chunk_and_save_park_file(park_file: Path) -> List[Dict]:
+    """Chunk a single park file and save its chunks next to the combined output"""
+    chunks = create_chunks_from_park_data(park_file)
+
+    output_file = OUTPUT_DIR / f"{park_file.stem}_chunks.json"
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps(chunks, option=orjson.OPT_APPEND_NEWLINE))
+
+    return chunks
+
+
+def create_chunks_from_wiki_file(wiki_file: Path) -> List[Dict]:
+    """Process a single Wikipedia file (one article or a list of them)"""
+    with open(wiki_file, 'r', encoding='utf-8') as f:
+        wiki_data = json.load(f)
+
+    chunks = []
+    # If the loaded data is a list, process each item; otherwise, process as a single dict
+    wiki_items = wiki_data if isinstance(wiki_data, list) else [wiki_data]
+    for item in wiki_items:
+        park_code = item.get("park_code", "unknown")
+        park_name = item.get("title", park_code.upper())
+        text = item.get("text", "")
+
+        if not text:
+            continue
+
+        # Chunk the text
+        text_chunks = chunk_text(text)
+
+        # Create chunk objects
+        source_url = item.get("url", f"https://en.wikipedia.org/wiki/{park_name}")
+        chunks.extend(
+            {
+                "id": f"{park_code}_wiki_chunk_{idx}",
+                "park_code": park_code,
+                "park_name": park_name,
+                "chunk_index": idx,
+                "text": chunk,
+                "token_count": token_count,
+                "source_url": source_url,
+                "source_type": "wikipedia",
+                "metadata": {
+                    "park_code": park_code,
+                    "park_name": park_name,
+                    "chunk_index": idx,
+                    "source": "wikipedia"
+                }
+            }
+            for idx, (chunk, token_count) in enumerate(text_chunks)
+        )
 
     return chunks
 
 
+def create_chunks_from_pdf_text(text_file: Path) -> List[Dict]:
+    """Process a single extracted PDF text file"""
+    # Extract park code from filename (e.g., "yose_brochure.txt" -> "yose")
+    filename = text_file.stem
+    park_code = filename.split('_')[0] if '_' in filename else filename
+
+    with open(text_file, 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    if not text or len(text) < 100:
+        return []
+
+    # Chunk the text
+    text_chunks = chunk_text(text)
+
+    # Create chunk objects
+    park_name = park_code.upper()
+    source_url = f"https://www.nps.gov/{park_code}/planyourvisit/brochures.htm"
+    return [
+        {
+            "id": f"{park_code}_pdf_chunk_{idx}",
+            "park_code": park_code,
+            "park_name": park_name,
+            "chunk_index": idx,
+            "text": chunk,
+            "token_count": token_count,
+            "source_url": source_url,
+            "source_type": "pdf",
+            "metadata": {
+                "park_code": park_code,
+                "chunk_index": idx,
+                "source": "pdf",
+                "original_file": text_file.name
+            }
+        }
+        for idx, (chunk, token_count) in enumerate(text_chunks)
+    ]
+
+
+def map_files(process_file, files: List[Path]) -> List[List[Dict]]:
+    """
+    Run process_file over files on every CPU core, returning results in file order.
+
+    Chunking is pure-Python CPU work and the files are independent, so each
+    worker process takes a few files at a time.
+    """
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        return list(tqdm(executor.map(process_file, files, chunksize=4), total=len(files)))
+
+
 def process_wikipedia_data():
     """Process Wikipedia articles if available"""
     wiki_dir = Path("../data/raw/wikipedia")
@@ -155,43 +320,8 @@ def process_wikipedia_data():
 
     print(f"\nProcessing {len(wiki_files)} Wikipedia articles...")
     all_chunks = []
-
-    for wiki_file in tqdm(wiki_files):
-        with open(wiki_file, 'r', encoding='utf-8') as f:
-            wiki_data = json.load(f)
-
-        # If the loaded data is a list, process each item; otherwise, process as a single dict
-        wiki_items = wiki_data if isinstance(wiki_data, list) else [wiki_data]
-        for item in wiki_items:
-            park_code = item.get("park_code", "unknown")
-            park_name = item.get("title", park_code.upper())
-            text = item.get("text", "")
-
-            if not text:
-                continue
-
-            # Chunk the text
-            text_chunks = chunk_text(text)
-
-            # Create chunk objects
-            for idx, chunk in enumerate(text_chunks):
-                chunk_obj = {
-                    "id": f"{park_code}_wiki_chunk_{idx}",
-                    "park_code": park_code,
-                    "park_name": park_name,
-                    "chunk_index": idx,
-                    "text": chunk,
-                    "token_count": count_tokens_approx(chunk),
-                    "source_url": item.get("url", f"https://en.wikipedia.org/wiki/{park_name}"),
-                    "source_type": "wikipedia",
-                    "metadata": {
-                        "park_code": park_code,
-                        "park_name": park_name,
-                        "chunk_index": idx,
-                        "source": "wikipedia"
-                    }
-                }
-                all_chunks.append(chunk_obj)
+    for chunks in map_files(create_chunks_from_wiki_file, wiki_files):
+        all_chunks.extend(chunks)
 
     print(f"  ✓ Created {len(all_chunks)} chunks from Wikipedia")
     return all_chunks
@@ -209,40 +339,8 @@ def process_pdf_texts():
 
     print(f"\nProcessing {len(text_files)} PDF text files...")
     all_chunks = []
-
-    for text_file in tqdm(text_files):
-        # Extract park code from filename (e.g., "yose_brochure.txt" -> "yose")
-        filename = text_file.stem
-        park_code = filename.split('_')[0] if '_' in filename else filename
-
-        with open(text_file, 'r', encoding='utf-8') as f:
-            text = f.read()
-
-        if not text or len(text) < 100:
-            continue
-
-        # Chunk the text
-        text_chunks = chunk_text(text)
-
-        # Create chunk objects
-        for idx, chunk in enumerate(text_chunks):
-            chunk_obj = {
-                "id": f"{park_code}_pdf_chunk_{idx}",
-                "park_code": park_code,
-                "park_name": park_code.upper(),
-                "chunk_index": idx,
-                "text": chunk,
-                "token_count": count_tokens_approx(chunk),
-                "source_url": f"https://www.nps.gov/{park_code}/planyourvisit/brochures.htm",
-                "source_type": "pdf",
-                "metadata": {
-                    "park_code": park_code,
-                    "chunk_index": idx,
-                    "source": "pdf",
-                    "original_file": text_file.name
-                }
-            }
-            all_chunks.append(chunk_obj)
+    for chunks in map_files(create_chunks_from_pdf_text, text_files):
+        all_chunks.extend(chunks)
 
     print(f"  ✓ Created {len(all_chunks)} chunks from PDFs")
     return all_chunks
@@ -261,6 +359,9 @@ def process_all_parks():
         print("Please run scrape_nps.py first.")
         return
 
+    if CHUNK_TOKENIZER and get_tokenizer() is None:
+        print(f"Warning: CHUNK_TOKENIZER={CHUNK_TOKENIZER} needs the tokenizers package; "
+              "approximating tokens by characters")
     print(f"Processing {len(park_files)} park files...")
 
     all_chunks = []
@@ -271,20 +372,13 @@ def process_all_parks():
         "chunks_by_source": {}
     }
 
-    # Process NPS data
-    for park_file in tqdm(park_files):
-        chunks = create_chunks_from_park_data(park_file)
+    # Process NPS data (each worker also saves its parks' individual chunk files)
+    for chunks in map_files(chunk_and_save_park_file, park_files):
         all_chunks.extend(chunks)
 
         stats["total_chunks"] += len(chunks)
         stats["total_tokens"] += sum(c["token_count"] for c in chunks)
 
-        # Save individual park chunks
-        park_code = park_file.stem
-        output_file = OUTPUT_DIR / f"{park_code}_chunks.json"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(chunks, f, indent=2, ensure_ascii=False)
-
     stats["chunks_by_source"]["nps"] = len(all_chunks)
 
     # Process Wikipedia data
@@ -303,12 +397,14 @@ def process_all_parks():
         stats["total_tokens"] += sum(c["token_count"] for c in pdf_chunks)
         stats["chunks_by_source"]["pdf"] = len(pdf_chunks)
 
-    # Save all chunks combined
-    combined_file = OUTPUT_DIR / "all_chunks.json"
-    with open(combined_file, 'w', encoding='utf-8') as f:
-        json.dump(all_chunks, f, indent=2, ensure_ascii=False)
+    # Save all chunks combined as JSON Lines, one chunk per line, so readers
+    # can stream it instead of parsing one corpus-sized array (orjson writes
+    # UTF-8 bytes directly, several times faster than json.dump)
+    combined_file = OUTPUT_DIR / "all_chunks.jsonl"
+    with open(combined_file, 'wb') as f:
+        f.writelines(orjson.dumps(chunk, option=orjson.OPT_APPEND_NEWLINE) for chunk in all_chunks)
 
-    # Save statistics
+    # Save statistics (small, so kept human-readable)
     stats_file = OUTPUT_DIR / "chunking_stats.json"
     with open(stats_file, 'w', encoding='utf-8') as f:
         json.dump(stats, f, indent=2)
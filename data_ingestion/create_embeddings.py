@@ -5,14 +5,18 @@ Now using Cohere API (no local models = low memory!)
 import os
 import json
 import time
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterator, List
 from tqdm import tqdm
 from dotenv import load_dotenv
 import cohere
 
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+)
 
 load_dotenv()
 
@@ -25,21 +29,34 @@ COHERE_MODEL = "embed-english-v3.0"  # Full model (1024-dim), not light (384-dim
 EMBEDDING_DIM = 1024  # Cohere embedding dimension
 
 INPUT_DIR = Path("../data/processed")
-CHUNKS_FILE = INPUT_DIR / "all_chunks.json"
+CHUNKS_FILE = INPUT_DIR / "all_chunks.jsonl"
 
+# Smaller batch size to stay under rate limit
+# Estimate ~500 tokens per chunk = ~25k tokens per batch
+# Process 3-4 batches per minute to stay safe
+COHERE_BATCH_SIZE = 50
+DELAY_SECONDS = 15  # Wait 15 seconds between batches
+
+
+def count_chunks() -> int:
+    """Number of chunks in CHUNKS_FILE, counted without parsing them"""
+    with open(CHUNKS_FILE, 'r', encoding='utf-8') as f:
+        return sum(1 for line in f if line.strip())
 
-def load_chunks() -> List[Dict]:
-    """Load all document chunks"""
-    if not CHUNKS_FILE.exists():
-        print(f"Error: {CHUNKS_FILE} not found")
-        print("Please run chunk_documents.py first")
-        return []
 
+def load_chunks() -> Iterator[Dict]:
+    """Yield document chunks one at a time"""
+    # JSON Lines: one chunk per line, parsed as it is read
     with open(CHUNKS_FILE, 'r', encoding='utf-8') as f:
-        chunks = json.load(f)
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
 
-    print(f"Loaded {len(chunks)} chunks from {CHUNKS_FILE}")
-    return chunks
+
+def batched(chunks: Iterator[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    """Group chunks into lists of at most batch_size"""
+    while batch := list(islice(chunks, batch_size)):
+        yield batch
 
 
 def initialize_qdrant() -> QdrantClient:
@@ -96,7 +113,16 @@ def initialize_qdrant() -> QdrantClient:
                 vectors_config=VectorParams(
                     size=EMBEDDING_DIM,
                     distance=Distance.COSINE
-                )
+                ),
+                # int8 copies of the vectors (4x smaller) are scored at search
+                # time; the backend rescores the top candidates at full precision
+                quantization_config=ScalarQuantization(
+                    scalar=ScalarQuantizationConfig(
+                        type=ScalarType.INT8,
+                        quantile=0.99,
+                        always_ram=True,
+                    )
+                ),
             )
             print(f"✓ Collection created successfully")
 
@@ -131,86 +157,34 @@ def initialize_cohere() -> cohere.ClientV2:
     return client
 
 
-def generate_embeddings(chunks: List[Dict], cohere_client: cohere.ClientV2) -> List[List[float]]:
-    """Generate embeddings for all chunks using Cohere API with rate limiting"""
-    print(f"Generating embeddings for {len(chunks)} chunks using Cohere...")
-    print("(Free tier rate limit: 100k tokens/min - adding delays to stay under limit)")
-
-    texts = [chunk["text"] for chunk in chunks]
-    all_embeddings = []
-
-    # Smaller batch size to stay under rate limit
-    # Estimate ~500 tokens per chunk = ~25k tokens per batch
-    # Process 3-4 batches per minute to stay safe
-    batch_size = 50
-    delay_seconds = 15  # Wait 15 seconds between batches
-
-    total_batches = (len(texts) + batch_size - 1) // batch_size
-    print(f"Processing in {total_batches} batches (15 sec delay between batches)")
-    print(f"Estimated time: {(total_batches * delay_seconds) // 60} minutes")
-
-    for i in tqdm(range(0, len(texts), batch_size)):
-        batch_texts = texts[i:i + batch_size]
-
-        try:
-            # Get embeddings from Cohere
-            response = cohere_client.embed(
-                texts=batch_texts,
-                model=COHERE_MODEL,
-                input_type="search_document",
-                embedding_types=["float"],
-            )
-
-            all_embeddings.extend(response.embeddings.float_)
-
-            # Debug: Check dimension of first embedding in first batch
-            if i == 0 and len(response.embeddings) > 0:
-                first_dim = len(response.embeddings[0])
-                print(f"\n✓ Cohere API working! Embedding dimension: {first_dim}")
-                if first_dim != EMBEDDING_DIM:
-                    print(f"❌ ERROR: Expected {EMBEDDING_DIM}-dim, got {first_dim}-dim!")
-                    print("Check your Cohere model and API key.")
-                    exit(1)
-
-            # Rate limiting: wait between batches (except last one)
-            if i + batch_size < len(texts):
-                time.sleep(delay_seconds)
-
-        except Exception as e:
-            print(f"\n⚠ Error on batch {i//batch_size + 1}: {e}")
-            print("Waiting 60 seconds before retry...")
-            time.sleep(60)
-            # Retry this batch
-            response = cohere_client.embed(
-                texts=batch_texts,
-                model=COHERE_MODEL,
-                input_type="search_document",
-                embedding_types=["float"],
-            )
-            all_embeddings.extend(response.embeddings.float_)
-
-    print(f"✓ Generated {len(all_embeddings)} embeddings")
-
-    # Final verification
-    if len(all_embeddings) > 0:
-        actual_dim = len(all_embeddings[0])
-        print(f"✓ Final check: Embedding dimension = {actual_dim}")
-        if actual_dim != EMBEDDING_DIM:
-            print(f"❌ CRITICAL ERROR: Embeddings are {actual_dim}-dim, not {EMBEDDING_DIM}-dim!")
-            print("Something went wrong with Cohere API.")
-            exit(1)
-
-    return all_embeddings
-
+def embed_batch(texts: List[str], cohere_client: cohere.ClientV2) -> List[List[float]]:
+    """Embed one batch of chunk texts, retrying once after a minute on error"""
+    try:
+        response = cohere_client.embed(
+            texts=texts,
+            model=COHERE_MODEL,
+            input_type="search_document",
+            embedding_types=["float"],
+        )
+    except Exception as e:
+        print(f"\n⚠ Error embedding batch: {e}")
+        print("Waiting 60 seconds before retry...")
+        time.sleep(60)
+        # Retry this batch
+        response = cohere_client.embed(
+            texts=texts,
+            model=COHERE_MODEL,
+            input_type="search_document",
+            embedding_types=["float"],
+        )
+    return response.embeddings.float_
 
-def upload_to_qdrant(client: QdrantClient, chunks: List[Dict], embeddings: List[List[float]]):
-    """Upload chunks and embeddings to Qdrant"""
-    print(f"Uploading {len(chunks)} points to Qdrant...")
 
-    points = []
-    for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-        point = PointStruct(
-            id=idx,
+def upload_to_qdrant(client: QdrantClient, chunks: List[Dict], embeddings: List[List[float]], first_id: int):
+    """Upload one batch of chunks and embeddings to Qdrant, numbering points from first_id"""
+    points = [
+        PointStruct(
+            id=first_id + idx,
             vector=embedding,
             payload={
                 "text": chunk["text"],
@@ -221,18 +195,50 @@ def upload_to_qdrant(client: QdrantClient, chunks: List[Dict], embeddings: List[
                 "chunk_id": chunk["id"]
             }
         )
-        points.append(point)
-
-    # Upload in batches
-    batch_size = 100
-    for i in tqdm(range(0, len(points), batch_size)):
-        batch = points[i:i + batch_size]
-        client.upsert(
-            collection_name=COLLECTION_NAME,
-            points=batch
-        )
+        for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings))
+    ]
+    client.upsert(
+        collection_name=COLLECTION_NAME,
+        points=points
+    )
 
-    print(f"✓ Uploaded {len(points)} points to Qdrant")
+
+def embed_and_upload(qdrant_client: QdrantClient, cohere_client: cohere.ClientV2, total_chunks: int) -> int:
+    """
+    Embed chunks with Cohere and upload them to Qdrant, one batch at a time.
+
+    Chunks are streamed from CHUNKS_FILE, so only one batch of chunks and
+    embeddings is held in memory. Returns the number of points uploaded.
+    """
+    print(f"Embedding and uploading {total_chunks} chunks using Cohere...")
+    print("(Free tier rate limit: 100k tokens/min - adding delays to stay under limit)")
+
+    total_batches = (total_chunks + COHERE_BATCH_SIZE - 1) // COHERE_BATCH_SIZE
+    print(f"Processing in {total_batches} batches ({DELAY_SECONDS} sec delay between batches)")
+    print(f"Estimated time: {(total_batches * DELAY_SECONDS) // 60} minutes")
+
+    uploaded = 0
+    for batch in tqdm(batched(load_chunks(), COHERE_BATCH_SIZE), total=total_batches):
+        # Rate limiting: wait between batches
+        if uploaded:
+            time.sleep(DELAY_SECONDS)
+
+        embeddings = embed_batch([chunk["text"] for chunk in batch], cohere_client)
+
+        # Check the embedding dimension on the first batch
+        if not uploaded and embeddings:
+            first_dim = len(embeddings[0])
+            print(f"\n✓ Cohere API working! Embedding dimension: {first_dim}")
+            if first_dim != EMBEDDING_DIM:
+                print(f"❌ ERROR: Expected {EMBEDDING_DIM}-dim, got {first_dim}-dim!")
+                print("Check your Cohere model and API key.")
+                exit(1)
+
+        upload_to_qdrant(qdrant_client, batch, embeddings, uploaded)
+        uploaded += len(batch)
+
+    print(f"✓ Uploaded {uploaded} points to Qdrant")
+    return uploaded
 
 
 def test_retrieval(qdrant_client: QdrantClient, cohere_client: cohere.ClientV2):
@@ -285,10 +291,15 @@ def main():
     print("National Parks Embeddings Creator (Cohere API)")
     print("=" * 50)
 
-    # Load chunks
-    chunks = load_chunks()
-    if not chunks:
+    # Count chunks (they are streamed from the file later)
+    if not CHUNKS_FILE.exists():
+        print(f"Error: {CHUNKS_FILE} not found")
+        print("Please run chunk_documents.py first")
         return
+    total_chunks = count_chunks()
+    if not total_chunks:
+        return
+    print(f"Found {total_chunks} chunks in {CHUNKS_FILE}")
 
     # Initialize Qdrant
     qdrant_client = initialize_qdrant()
@@ -296,11 +307,8 @@ def main():
     # Initialize Cohere
     cohere_client = initialize_cohere()
 
-    # Generate embeddings
-    embeddings = generate_embeddings(chunks, cohere_client)
-
-    # Upload to Qdrant
-    upload_to_qdrant(qdrant_client, chunks, embeddings)
+    # Generate embeddings and upload to Qdrant, batch by batch
+    uploaded = embed_and_upload(qdrant_client, cohere_client, total_chunks)
 
     # Test retrieval
     test_retrieval(qdrant_client, cohere_client)
@@ -308,7 +316,7 @@ def main():
     print("\n" + "=" * 50)
     print("✓ All done! Your vector database is ready.")
     print(f"✓ Collection: {COLLECTION_NAME}")
-    print(f"✓ Total vectors: {len(chunks)}")
+    print(f"✓ Total vectors: {uploaded}")
     print(f"✓ Embedding dimension: {EMBEDDING_DIM}")
     print("=" * 50)
 
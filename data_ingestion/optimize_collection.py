@@ -0,0 +1,148 @@
+"""
+Tune an existing Qdrant collection for search latency.
+
+Quantization: each 1024-dim embed-english-v3.0 vector is 4KB as float32;
+quantized to int8 it is 1KB, so Qdrant scores candidates against a 4x smaller,
+RAM-resident copy and rescores only the best few with the original vectors
+(the backend asks for rescore with 2x oversampling), for well under 1% recall
+loss.
+
+RAM residency: with on_disk storage, every HNSW hop that lands on an uncached
+mmap page stalls on disk.  The collection is small (~2,000 vectors, ~8MB), so
+both the original vectors and the HNSW graph are switched to in-memory.
+
+HNSW graph: m (links per node) and ef_construct (build-time search breadth)
+are sized to the collection.  A better-connected graph reaches the same recall
+with a smaller search-time hnsw_ef; for a small collection the extra links
+cost little memory and the rebuild takes seconds.  payload_m adds links within
+each park_code value, which keeps recall up for the backend's park-filtered
+searches.
+
+create_embeddings.py enables quantization on collections it creates; run this
+script once for a collection created before that, and again after re-ingesting.
+All steps are idempotent.
+"""
+import os
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    HnswConfigDiff,
+    PayloadSchemaType,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    VectorParamsDiff,
+)
+
+load_dotenv(dotenv_path="../.env")
+
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+COLLECTION_NAME = "national_parks"
+
+QUANTIZATION_CONFIG = ScalarQuantization(
+    scalar=ScalarQuantizationConfig(
+        type=ScalarType.INT8,
+        quantile=0.99,     # clip outliers so the int8 range isn't wasted on them
+        always_ram=True,   # keep the quantized vectors in RAM even if originals are on disk
+    )
+)
+
+
+def enable_quantization(client: QdrantClient):
+    current = client.get_collection(COLLECTION_NAME).config.quantization_config
+    if current is not None:
+        print(f"OK Quantization already enabled: {current}")
+        return True
+
+    print(f"Enabling int8 scalar quantization on '{COLLECTION_NAME}'...")
+    try:
+        client.update_collection(
+            collection_name=COLLECTION_NAME,
+            quantization_config=QUANTIZATION_CONFIG,
+        )
+        print("OK Quantization enabled. Qdrant builds the quantized vectors in the background.")
+        return True
+    except Exception as e:
+        print(f"FAILED to enable quantization: {e}")
+        return False
+
+
+def keep_in_ram(client: QdrantClient):
+    config = client.get_collection(COLLECTION_NAME).config
+    vectors_on_disk = bool(config.params.vectors.on_disk)
+    hnsw_on_disk = bool(config.hnsw_config.on_disk)
+    if not vectors_on_disk and not hnsw_on_disk:
+        print("OK Vectors and HNSW index are already in RAM.")
+        return True
+
+    print(f"Moving vectors and HNSW index of '{COLLECTION_NAME}' into RAM...")
+    try:
+        client.update_collection(
+            collection_name=COLLECTION_NAME,
+            vectors_config={"": VectorParamsDiff(on_disk=False)},
+            hnsw_config=HnswConfigDiff(on_disk=False),
+        )
+        print("OK Vectors and HNSW index will be served from RAM.")
+        return True
+    except Exception as e:
+        print(f"FAILED to move collection into RAM: {e}")
+        return False
+
+
+def configure_hnsw_params(vector_count: int) -> HnswConfigDiff:
+    """HNSW build parameters for a collection of vector_count points."""
+    if vector_count < 100_000:
+        m, ef_construct = 24, 200
+    elif vector_count < 1_000_000:
+        m, ef_construct = 24, 128
+    else:
+        m, ef_construct = 32, 128
+    return HnswConfigDiff(m=m, ef_construct=ef_construct, payload_m=16)
+
+
+def tune_hnsw(client: QdrantClient):
+    info = client.get_collection(COLLECTION_NAME)
+    target = configure_hnsw_params(info.points_count or 0)
+    current = info.config.hnsw_config
+    if (current.m, current.ef_construct, current.payload_m) == (
+        target.m, target.ef_construct, target.payload_m
+    ):
+        print(f"OK HNSW already tuned: m={current.m}, ef_construct={current.ef_construct}")
+        return True
+
+    print(
+        f"Rebuilding HNSW index of '{COLLECTION_NAME}' ({info.points_count} points) "
+        f"with m={target.m}, ef_construct={target.ef_construct}, payload_m={target.payload_m}..."
+    )
+    try:
+        # payload_m only builds per-park links for fields with a payload index
+        client.create_payload_index(
+            collection_name=COLLECTION_NAME,
+            field_name="park_code",
+            field_schema=PayloadSchemaType.KEYWORD,
+        )
+        client.update_collection(collection_name=COLLECTION_NAME, hnsw_config=target)
+        print("OK HNSW parameters updated. Qdrant rebuilds the index in the background.")
+        return True
+    except Exception as e:
+        print(f"FAILED to update HNSW parameters: {e}")
+        return False
+
+
+def optimize_collection():
+    if not QDRANT_URL or not QDRANT_API_KEY:
+        print("Error: QDRANT_URL and QDRANT_API_KEY must be set in .env")
+        return False
+
+    print(f"Connecting to Qdrant at {QDRANT_URL}...")
+    client = QdrantClient(url=QDRANT_URL.strip(), api_key=QDRANT_API_KEY.strip())
+
+    quantized = enable_quantization(client)
+    in_ram = keep_in_ram(client)
+    tuned = tune_hnsw(client)
+    return quantized and in_ram and tuned
+
+
+if __name__ == "__main__":
+    optimize_collection()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The ingestion scripts run as flat modules (`python chunk_documents.py` from data_ingestion/)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
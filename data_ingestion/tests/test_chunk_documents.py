@@ -0,0 +1,85 @@
+import re
+from types import SimpleNamespace
+
+import chunk_documents
+
+
+class WhitespaceTokenizer:
+    """Stands in for a tokenizers.Tokenizer: one token per whitespace-separated word"""
+
+    def encode(self, text, add_special_tokens=True):
+        offsets = [m.span() for m in re.finditer(r"\S+", text)]
+        return SimpleNamespace(offsets=offsets)
+
+
+# ─────────────────────────── find_break ───────────────────────────────────────
+
+def test_find_break_prefers_paragraph_break():
+    text = "One. Two.\n\nThree. Four"
+    assert chunk_documents.find_break(text, 0, len(text)) == text.index("Three")
+
+
+def test_find_break_falls_back_to_sentence_break():
+    text = "One two. Three four"
+    assert chunk_documents.find_break(text, 0, len(text)) == text.index("Three")
+
+
+def test_find_break_returns_end_without_a_break():
+    text = "one two three four"
+    assert chunk_documents.find_break(text, 0, 10) == 10
+
+
+def test_find_break_ignores_breaks_before_window():
+    text = "One. two three four"
+    assert chunk_documents.find_break(text, 5, len(text)) == len(text)
+
+
+# ─────────────────────────── chunk_text_by_tokens ─────────────────────────────
+
+def test_chunk_text_by_tokens_counts_real_tokens():
+    text = " ".join(f"w{i}" for i in range(25))
+    chunks = chunk_documents.chunk_text_by_tokens(text, WhitespaceTokenizer(), 10, 2)
+
+    assert [count for _, count in chunks] == [10, 10, 9]
+    for chunk, count in chunks:
+        assert len(chunk.split()) == count
+
+
+def test_chunk_text_by_tokens_overlaps_chunks():
+    text = " ".join(f"w{i}" for i in range(25))
+    chunks = chunk_documents.chunk_text_by_tokens(text, WhitespaceTokenizer(), 10, 2)
+
+    assert chunks[0][0].split()[-2:] == chunks[1][0].split()[:2]
+    assert chunks[-1][0].endswith("w24")
+
+
+def test_chunk_text_by_tokens_ends_chunks_at_sentence_break():
+    text = "a b c d e f. g h i j k l m n"
+    chunks = chunk_documents.chunk_text_by_tokens(text, WhitespaceTokenizer(), 8, 0)
+
+    assert chunks[0] == ("a b c d e f.", 6)
+    assert chunks[1] == ("g h i j k l m n", 8)
+
+
+def test_chunk_text_by_tokens_short_text_is_one_chunk():
+    chunks = chunk_documents.chunk_text_by_tokens("just a few words", WhitespaceTokenizer(), 10, 2)
+    assert chunks == [("just a few words", 4)]
+
+
+# ─────────────────────────── chunk_text / token_count ─────────────────────────
+
+def test_chunk_text_without_tokenizer_estimates_four_chars_per_token(monkeypatch):
+    monkeypatch.setattr(chunk_documents, "get_tokenizer", lambda: None)
+    chunks = chunk_documents.chunk_text("x" * 400)
+    assert chunks == [("x" * 400, 100)]
+
+
+def test_pdf_chunks_record_tokenizer_counts(monkeypatch, tmp_path):
+    monkeypatch.setattr(chunk_documents, "get_tokenizer", lambda: WhitespaceTokenizer())
+    text_file = tmp_path / "zion_brochure.txt"
+    text_file.write_text(" ".join(f"word{i}" for i in range(30)), encoding="utf-8")
+
+    chunks = chunk_documents.create_chunks_from_pdf_text(text_file)
+
+    assert [c["token_count"] for c in chunks] == [30]
+    assert chunks[0]["park_code"] == "zion"
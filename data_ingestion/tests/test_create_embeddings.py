@@ -0,0 +1,69 @@
+import json
+from types import GeneratorType, SimpleNamespace
+
+import create_embeddings
+
+
+def _write_chunks(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for idx in range(count):
+            chunk = {
+                "id": f"zion_chunk_{idx}",
+                "park_code": "zion",
+                "park_name": "Zion National Park",
+                "chunk_index": idx,
+                "text": f"chunk {idx}",
+                "source_url": "https://www.nps.gov/zion/index.htm",
+            }
+            f.write(json.dumps(chunk) + "\n")
+        f.write("\n")
+
+
+class FakeCohere:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def embed(self, texts, **kwargs):
+        self.batch_sizes.append(len(texts))
+        vectors = [[0.0] * create_embeddings.EMBEDDING_DIM for _ in texts]
+        return SimpleNamespace(embeddings=SimpleNamespace(float_=vectors))
+
+
+class FakeQdrant:
+    def __init__(self):
+        self.upserts = []
+
+    def upsert(self, collection_name, points):
+        self.upserts.append([point.id for point in points])
+
+
+def test_load_chunks_streams_lines(monkeypatch, tmp_path):
+    chunks_file = tmp_path / "all_chunks.jsonl"
+    _write_chunks(chunks_file, 3)
+    monkeypatch.setattr(create_embeddings, "CHUNKS_FILE", chunks_file)
+
+    chunks = create_embeddings.load_chunks()
+
+    assert isinstance(chunks, GeneratorType)
+    assert [c["id"] for c in chunks] == ["zion_chunk_0", "zion_chunk_1", "zion_chunk_2"]
+    assert create_embeddings.count_chunks() == 3
+
+
+def test_batched_groups_chunks():
+    batches = list(create_embeddings.batched(iter(range(7)), 3))
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_embed_and_upload_works_batch_by_batch(monkeypatch, tmp_path):
+    chunks_file = tmp_path / "all_chunks.jsonl"
+    _write_chunks(chunks_file, 5)
+    monkeypatch.setattr(create_embeddings, "CHUNKS_FILE", chunks_file)
+    monkeypatch.setattr(create_embeddings, "COHERE_BATCH_SIZE", 2)
+    monkeypatch.setattr(create_embeddings.time, "sleep", lambda seconds: None)
+    cohere_client, qdrant_client = FakeCohere(), FakeQdrant()
+
+    uploaded = create_embeddings.embed_and_upload(qdrant_client, cohere_client, 5)
+
+    assert uploaded == 5
+    assert cohere_client.batch_sizes == [2, 2, 1]
+    assert qdrant_client.upserts == [[0, 1], [2, 3], [4]]